@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Mapping
+
+from aiogram import Bot
+from aiogram.enums import ChatMemberStatus, ChatType
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import Message
+
+from ttl_map import TTLMap
+
+MEMBER_STATUSES = {ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.MEMBER}
+
+
+@dataclass(frozen=True)
+class AccessPolicy:
+    chats: frozenset[int] = frozenset()  # порожньо і без chat_users — будь-яка група
+    users: frozenset[int] = frozenset()  # порожньо — будь-хто в дозволеній групі
+    # групи з chat_users дозволені й поза chats; лише chat_users — лише ці групи
+    chat_users: Mapping[int, frozenset[int]] = field(default_factory=lambda: MappingProxyType({}))
+
+    def allows(self, chat_id: int, user_id: int | None) -> bool:
+        if (self.chats or self.chat_users) and chat_id not in self.chats and chat_id not in self.chat_users:
+            return False
+        users = self.chat_users.get(chat_id, self.users)
+        if users:
+            return user_id is not None and user_id in users
+        return True
+
+
+def _ids(values) -> frozenset[int]:
+    return frozenset(int(v) for v in values)
+
+
+def compile_policy(chats=(), users=(), chat_users: dict | None = None) -> AccessPolicy:
+    return AccessPolicy(
+        _ids(chats),
+        _ids(users),
+        MappingProxyType({int(chat): _ids(ids) for chat, ids in (chat_users or {}).items()}),
+    )
+
+
+def load_policy(path: str) -> AccessPolicy:
+    """JSON: ``{"chats": [...], "users": [...], "chat_users": {"<chat_id>": [...]}}``."""
+    with open(path, encoding="utf-8") as fh:
+        raw = json.load(fh)
+    return compile_policy(raw.get("chats", ()), raw.get("users", ()), raw.get("chat_users"))
+
+
+class AccessControl:
+    """Outer-middleware для повідомлень: відсікає групи й користувачів поза політикою.
+
+    Приватні чати пропускаються завжди (майстер заявки). Політика компілюється
+    один раз; якщо задано файл конфігурації, вона атомарно перечитується при
+    зміні файлу або за ``reload()`` (SIGHUP), без зупинки бота. Якщо файл
+    зламаний — лишається попередня політика.
+
+    ``is_agent`` — для даних клієнтів (архів заявок): агент — це користувач
+    зі списків політики або учасник дозволеної групи (getChatMember, з кешем
+    на ``agent_ttl`` секунд). Без груп і користувачів у політиці агентів немає.
+    """
+
+    def __init__(self, fallback: AccessPolicy, path: str | None = None, agent_ttl: float = 300.0):
+        self.fallback = fallback
+        self.path = path
+        self.policy = fallback
+        self._mtime: float | None = None
+        self._watcher: asyncio.Task | None = None
+        self._agents: TTLMap[int, bool] = TTLMap(agent_ttl, max_size=10000)
+        self.reload()
+
+    def reload(self) -> bool:
+        if not self.path:
+            return False
+        try:
+            mtime = os.path.getmtime(self.path)
+            policy = load_policy(self.path)
+        except FileNotFoundError:
+            self.policy, self._mtime = self.fallback, None
+            return False
+        except (OSError, ValueError, TypeError, AttributeError):
+            return False
+        self.policy, self._mtime = policy, mtime
+        self._agents.clear()
+        return True
+
+    def allowed(self, message: Message) -> bool:
+        if message.chat.type == ChatType.PRIVATE:
+            return True
+        if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+            return False
+        return self.policy.allows(message.chat.id, message.from_user.id if message.from_user else None)
+
+    async def is_agent(self, bot: Bot, user_id: int) -> bool:
+        policy = self.policy
+        if user_id in policy.users or any(user_id in ids for ids in policy.chat_users.values()):
+            return True
+        cached = self._agents.get(user_id)
+        if cached is not None:
+            return cached
+        ok = False
+        for chat_id in policy.chats | frozenset(policy.chat_users):
+            if not policy.allows(chat_id, user_id):
+                continue
+            try:
+                member = await bot.get_chat_member(chat_id, user_id)
+            except TelegramAPIError:
+                continue
+            if member.status in MEMBER_STATUSES or getattr(member, "is_member", False):
+                ok = True
+                break
+        self._agents[user_id] = ok
+        return ok
+
+    async def __call__(self, handler, message: Message, data: dict):
+        if not self.allowed(message):
+            return None
+        return await handler(message, data)
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+            if mtime != self._mtime:
+                self.reload()
+
+    def start(self, interval: float = 5.0):
+        if self.path:
+            self._watcher = asyncio.create_task(self._watch(interval))
+
+    async def stop(self):
+        if self._watcher:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
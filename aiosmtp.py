@@ -0,0 +1,356 @@
+import asyncio
+import base64
+import ssl
+import time
+from typing import AsyncIterable, Iterable
+
+CRLF = b"\r\n"
+BDAT_CHUNK = 1 << 20
+
+
+class SMTPError(Exception):
+    def __init__(self, code: int, message: str, command: str = ""):
+        super().__init__(f"{code} {message}" + (f" (на {command})" if command else ""))
+        self.code = code
+        self.message = message
+        self.command = command
+
+
+class SMTPDisconnected(SMTPError):
+    def __init__(self, message: str = "з'єднання закрито сервером"):
+        super().__init__(421, message)
+
+
+class _ResumingContext(ssl.SSLContext):
+    # SSLContext, який підставляє останню TLS-сесію (session resumption),
+    # тож повторні конекти до того ж сервера обходяться без повного handshake;
+    # asyncio загортає сокет через wrap_bio, smtplib — через wrap_socket
+    session: ssl.SSLSession | None = None
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        if kwargs.get("session") is None and self.session is not None:
+            kwargs["session"] = self.session
+        return super().wrap_socket(sock, *args, **kwargs)
+
+    def wrap_bio(self, incoming, outgoing, *args, **kwargs):
+        if kwargs.get("session") is None and self.session is not None:
+            kwargs["session"] = self.session
+        return super().wrap_bio(incoming, outgoing, *args, **kwargs)
+
+
+def make_tls_context(verify: bool = True) -> _ResumingContext:
+    ctx = _ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+    if verify:
+        ctx.load_default_certs()
+    else:
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+class DotStuffer:
+    # dot-stuffing для DATA між межами чанків: "." на початку рядка -> ".."
+    def __init__(self):
+        self._bol = True
+
+    def __call__(self, chunk: bytes) -> bytes:
+        if not chunk:
+            return chunk
+        out = chunk.replace(b"\n.", b"\n..")
+        if self._bol and out[:1] == b".":
+            out = b"." + out
+        self._bol = chunk.endswith(b"\n")
+        return out
+
+
+class SMTPConnection:
+    """Асинхронний SMTP-клієнт на asyncio streams.
+
+    ``security``: "ssl" (типово для 465), "starttls" (типово для решти портів)
+    або "none" — лише для локальних тестових серверів. AUTH PLAIN/LOGIN, ESMTP PIPELINING для
+    MAIL/RCPT/DATA і CHUNKING (BDAT), якщо сервер їх оголошує; інакше —
+    звичайний DATA з dot-stuffing.
+
+    ``timings`` — скільки секунд зайняла остання фаза кожного виду:
+    "connect" (TCP, привітання, EHLO), "tls" (handshake; для STARTTLS — разом
+    із командою і повторним EHLO), "auth" і "transfer" (конверт і тіло листа).
+    """
+
+    def __init__(self, host: str, port: int, tls_context: ssl.SSLContext | None = None,
+                 timeout: float = 30.0, local_hostname: str = "localhost",
+                 use_pipelining: bool = True, use_chunking: bool = True, security: str | None = None,
+                 server_hostname: str | None = None):
+        self.host = host
+        # ім'я для SNI і перевірки сертифіката, якщо host — уже розв'язана IP-адреса
+        self.server_hostname = server_hostname or host
+        self.port = port
+        self.security = security or ("ssl" if port == 465 else "starttls")
+        self.tls_context = tls_context or make_tls_context()
+        self.timeout = timeout
+        self.local_hostname = local_hostname
+        self.use_pipelining = use_pipelining
+        self.use_chunking = use_chunking
+        self.extensions: dict[str, str] = {}
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        self.timings: dict[str, float] = {}
+
+    # ---------- транспорт ----------
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    @property
+    def max_size(self) -> int | None:
+        size = self.extensions.get("size", "")
+        return int(size) if size.isdigit() and int(size) > 0 else None
+
+    @property
+    def pipelining(self) -> bool:
+        return self.use_pipelining and "pipelining" in self.extensions
+
+    @property
+    def chunking(self) -> bool:
+        return self.use_chunking and "chunking" in self.extensions
+
+    @property
+    def tls_session(self) -> ssl.SSLSession | None:
+        sslobj = self.writer.get_extra_info("ssl_object") if self.writer else None
+        return sslobj.session if sslobj is not None else None
+
+    def _timed(self, phase: str, started: float):
+        self.timings[phase] = self.timings.get(phase, 0.0) + time.perf_counter() - started
+
+    async def connect_tcp(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+
+    async def tls_handshake(self):
+        # для "ssl" — одразу після TCP, для "starttls" — після команди STARTTLS
+        await asyncio.wait_for(
+            self.writer.start_tls(self.tls_context, server_hostname=self.server_hostname), self.timeout
+        )
+
+    async def greet(self):
+        await self.expect(220, "connect")
+
+    async def starttls(self):
+        await self.command("STARTTLS", expect=220)
+        await self.tls_handshake()
+        self.extensions = {}
+
+    async def connect(self):
+        self.timings = {}
+        started = time.perf_counter()
+        await self.connect_tcp()
+        try:
+            if self.security == "ssl":
+                self._timed("connect", started)
+                started = time.perf_counter()
+                await self.tls_handshake()
+                self._timed("tls", started)
+                started = time.perf_counter()
+            await self.greet()
+            await self.ehlo()
+            self._timed("connect", started)
+            if self.security == "starttls":
+                started = time.perf_counter()
+                await self.starttls()
+                await self.ehlo()
+                self._timed("tls", started)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.writer = None
+        self.reader = None
+
+    async def quit(self):
+        try:
+            await self.command("QUIT", expect=221)
+        except Exception:
+            pass
+        finally:
+            self.close()
+
+    # ---------- протокол ----------
+    async def read_reply(self) -> tuple[int, str]:
+        lines = []
+        while True:
+            try:
+                line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                self.close()
+                raise SMTPDisconnected(str(e)) from e
+            if not line:
+                self.close()
+                raise SMTPDisconnected()
+            lines.append(line[4:].rstrip(b"\r\n").decode("utf-8", "replace"))
+            if line[3:4] != b"-":
+                return int(line[:3]), "\n".join(lines)
+
+    async def expect(self, code: int | tuple[int, ...], command: str = "") -> str:
+        got, message = await self.read_reply()
+        codes = code if isinstance(code, tuple) else (code,)
+        if got not in codes:
+            raise SMTPError(got, message, command)
+        return message
+
+    def write(self, data: bytes):
+        if not self.connected:
+            raise SMTPDisconnected()
+        self.writer.write(data)
+
+    async def command(self, line: str, expect: int | tuple[int, ...] = 250) -> str:
+        self.write(line.encode() + CRLF)
+        await self.writer.drain()
+        return await self.expect(expect, line.split(" ", 1)[0])
+
+    async def ehlo(self):
+        message = await self.command(f"EHLO {self.local_hostname}")
+        ext = {}
+        for line in message.split("\n")[1:]:
+            name, _, params = line.partition(" ")
+            ext[name.lower()] = params
+        self.extensions = ext
+
+    async def login(self, user: str, password: str):
+        started = time.perf_counter()
+        try:
+            await self._login(user, password)
+        finally:
+            self.timings["auth"] = time.perf_counter() - started
+
+    async def _login(self, user: str, password: str):
+        methods = self.extensions.get("auth", "").upper().split()
+        if "PLAIN" in methods or not methods:
+            token = base64.b64encode(f"\0{user}\0{password}".encode()).decode()
+            await self.command(f"AUTH PLAIN {token}", expect=235)
+        else:
+            await self.command("AUTH LOGIN", expect=334)
+            await self.command(base64.b64encode(user.encode()).decode(), expect=334)
+            await self.command(base64.b64encode(password.encode()).decode(), expect=235)
+
+    async def noop(self):
+        await self.command("NOOP")
+
+    async def rset(self):
+        await self.command("RSET")
+
+    # ---------- відправка ----------
+    async def _envelope(self, mail_from: str, rcpt_to: list[str], size: int | None,
+                        with_data: bool) -> dict[str, tuple[int, str]]:
+        mail = f"MAIL FROM:<{mail_from}>"
+        if size is not None and "size" in self.extensions:
+            mail += f" SIZE={size}"
+        if "8bitmime" in self.extensions:
+            mail += " BODY=8BITMIME"
+        lines = [mail] + [f"RCPT TO:<{r}>" for r in rcpt_to] + (["DATA"] if with_data else [])
+
+        if self.pipelining:
+            # одним пакетом — один RTT замість 2 + кількість отримувачів
+            self.write(b"".join(line.encode() + CRLF for line in lines))
+            await self.writer.drain()
+            replies = [await self.read_reply() for _ in lines]
+        else:
+            replies = []
+            for i, line in enumerate(lines):
+                if line == "DATA" and all(r[0] not in (250, 251) for r in replies[1:]):
+                    break
+                self.write(line.encode() + CRLF)
+                await self.writer.drain()
+                replies.append(await self.read_reply())
+                if i == 0 and replies[0][0] != 250:
+                    break
+
+        data_open = with_data and len(replies) == len(lines) and replies[-1][0] == 354
+
+        async def abort(code: int, message: str, command: str):
+            if data_open:
+                # сервер уже чекає тіло — коректно перервати DATA можна лише розривом
+                self.close()
+            else:
+                await self._reset_quietly()
+            raise SMTPError(code, message, command)
+
+        if replies[0][0] != 250:
+            await abort(*replies[0], "MAIL")
+        rcpt_replies = replies[1:1 + len(rcpt_to)]
+        refused = {r: rep for r, rep in zip(rcpt_to, rcpt_replies) if rep[0] not in (250, 251)}
+        if len(refused) == len(rcpt_to):
+            await abort(*rcpt_replies[0], "RCPT")
+        if with_data and not data_open:
+            await abort(*replies[-1], "DATA")
+        return refused
+
+    async def _reset_quietly(self):
+        try:
+            await self.rset()
+        except Exception:
+            self.close()
+
+    async def sendmail(self, mail_from: str, rcpt_to: list[str],
+                       chunks: bytes | Iterable[bytes] | AsyncIterable[bytes],
+                       size: int | None = None) -> dict[str, tuple[int, str]]:
+        """Відправляє лист; повертає отримувачів, яких сервер відхилив (якщо не всіх)."""
+        started = time.perf_counter()
+        try:
+            return await self._sendmail(mail_from, rcpt_to, chunks, size)
+        finally:
+            self.timings["transfer"] = time.perf_counter() - started
+
+    async def _sendmail(self, mail_from: str, rcpt_to: list[str],
+                        chunks: bytes | Iterable[bytes] | AsyncIterable[bytes],
+                        size: int | None) -> dict[str, tuple[int, str]]:
+        if isinstance(chunks, (bytes, bytearray)):
+            size = len(chunks) if size is None else size
+            chunks = [bytes(chunks[i:i + BDAT_CHUNK]) for i in range(0, len(chunks), BDAT_CHUNK)] or [b""]
+
+        if self.chunking:
+            refused = await self._envelope(mail_from, rcpt_to, size, with_data=False)
+            await self._send_bdat(chunks)
+        else:
+            refused = await self._envelope(mail_from, rcpt_to, size, with_data=True)
+            await self._send_data(chunks)
+        return refused
+
+    async def _send_data(self, chunks):
+        stuff = DotStuffer()
+        tail = b""
+        async for chunk in _aiter(chunks):
+            if chunk:
+                self.write(stuff(chunk))
+                tail = (tail + chunk)[-2:]
+                await self.writer.drain()
+        self.write((b"" if tail.endswith(CRLF) else CRLF) + b"." + CRLF)
+        await self.writer.drain()
+        await self.expect(250, "DATA")
+
+    async def _send_bdat(self, chunks):
+        # BDAT не потребує dot-stuffing; останній чанк позначаємо LAST
+        pending: bytes | None = None
+        async for chunk in _aiter(chunks):
+            if not chunk:
+                continue
+            if pending is not None:
+                self.write(f"BDAT {len(pending)}".encode() + CRLF + pending)
+                await self.writer.drain()
+                await self.expect(250, "BDAT")
+            pending = chunk
+        pending = pending or b""
+        self.write(f"BDAT {len(pending)} LAST".encode() + CRLF + pending)
+        await self.writer.drain()
+        await self.expect(250, "BDAT")
+
+
+async def _aiter(chunks):
+    if hasattr(chunks, "__aiter__"):
+        async for chunk in chunks:
+            yield chunk
+    else:
+        for chunk in chunks:
+            yield chunk
@@ -0,0 +1,185 @@
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS applications (
+    id          INTEGER PRIMARY KEY,
+    sent_at     REAL NOT NULL,
+    sender_id   INTEGER NOT NULL,
+    sender      TEXT NOT NULL,
+    chat_id     INTEGER NOT NULL,
+    fullname    TEXT NOT NULL,
+    name_key    TEXT NOT NULL,
+    tax_id      TEXT NOT NULL,
+    phone       TEXT NOT NULL,
+    phone_key   TEXT NOT NULL,
+    shop_addr   TEXT NOT NULL,
+    product     TEXT NOT NULL,
+    price       TEXT NOT NULL,
+    downpay     TEXT NOT NULL,
+    grace       TEXT NOT NULL,
+    files       INTEGER NOT NULL,
+    job_id      INTEGER,
+    routes      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS applications_tax   ON applications (tax_id, sent_at);
+CREATE INDEX IF NOT EXISTS applications_phone ON applications (phone_key, sent_at);
+CREATE INDEX IF NOT EXISTS applications_name  ON applications (name_key, sent_at);
+CREATE INDEX IF NOT EXISTS applications_who   ON applications (sender, sent_at);
+CREATE INDEX IF NOT EXISTS applications_sent  ON applications (sent_at);
+"""
+# повнотекстовий індекс над товаром і адресою ТТ; сам текст лежить в applications
+_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS applications_fts USING fts5(
+    product, shop_addr, content='applications', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+"""
+_COLUMNS = ("id, sent_at, sender_id, sender, chat_id, fullname, tax_id, phone, shop_addr, "
+            "product, price, downpay, grace, files, job_id, routes")
+
+
+@dataclass(frozen=True)
+class Application:
+    id: int
+    sent_at: float
+    sender_id: int
+    sender: str
+    chat_id: int
+    fullname: str
+    tax_id: str
+    phone: str
+    shop_addr: str
+    product: str
+    price: str
+    downpay: str
+    grace: str
+    files: int
+    job_id: int | None
+    routes: str
+
+
+def name_key(value: str) -> str:
+    # SQLite lower() не знає кирилиці, тож регістр і пробіли зводимо тут
+    return " ".join(value.casefold().replace("’", "'").split())
+
+
+def phone_key(value: str) -> str:
+    # останні 9 цифр: 050..., 38050..., +38 (050) ... — той самий номер
+    return re.sub(r"\D", "", value)[-9:]
+
+
+def _fts_query(text: str) -> str:
+    # кожне слово — префікс, усі слова обов'язкові; лапки екрануються подвоєнням
+    words = re.findall(r"\w+", text)
+    return " ".join('"' + w.replace('"', '""') + '"*' for w in words)
+
+
+class ApplicationArchive:
+    """Архів відправлених заявок для пошуку через /find і перевірки дублів ІПН.
+
+    Один рядок на заявку, поставлену в чергу листів. ІПН, телефон (останні 9
+    цифр), ПІБ (без регістру), відправник і час проіндексовані, товар і
+    адреса ТТ — у FTS5, тож пошук не сканує таблицю навіть на сотнях тисяч
+    заявок. Якщо SQLite зібрано без FTS5, текстовий пошук іде через LIKE.
+    """
+
+    def __init__(self, db_path: str):
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        try:
+            self._db.executescript(_FTS)
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False
+        self._lock = threading.Lock()
+
+    def _insert(self, row: dict) -> int:
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                cur = self._db.execute(
+                    "INSERT INTO applications (sent_at, sender_id, sender, chat_id, fullname, name_key, tax_id, "
+                    "phone, phone_key, shop_addr, product, price, downpay, grace, files, job_id, routes) "
+                    "VALUES (:sent_at, :sender_id, :sender, :chat_id, :fullname, :name_key, :tax_id, :phone, "
+                    ":phone_key, :shop_addr, :product, :price, :downpay, :grace, :files, :job_id, :routes)",
+                    row,
+                )
+                if self.fts:
+                    self._db.execute(
+                        "INSERT INTO applications_fts (rowid, product, shop_addr) VALUES (?, ?, ?)",
+                        (cur.lastrowid, row["product"], row["shop_addr"]),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            return cur.lastrowid
+
+    async def record(self, sender_id: int, sender: str, chat_id: int, data: dict, files: int,
+                     job_id: int | None = None, routes: list[str] = ()) -> int:
+        """Заносить відправлену заявку; ``data`` — поля майстра з FSM."""
+        def field(k: str) -> str:
+            return str(data.get(k, "")).strip()
+
+        row = {
+            "sent_at": time.time(), "sender_id": sender_id, "sender": sender.lstrip("@").lower(),
+            "chat_id": chat_id, "fullname": field("fullname"), "name_key": name_key(field("fullname")),
+            "tax_id": re.sub(r"\s", "", field("tax_id")), "phone": field("phone"),
+            "phone_key": phone_key(field("phone")), "shop_addr": field("shop_addr"),
+            "product": field("product"), "price": field("price"), "downpay": field("downpay"),
+            "grace": field("grace"), "files": files, "job_id": job_id, "routes": ",".join(routes),
+        }
+        return await asyncio.to_thread(self._insert, row)
+
+    def _select(self, where: str, params: tuple, limit: int) -> list[Application]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {_COLUMNS} FROM applications WHERE {where} ORDER BY sent_at DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [Application(*r) for r in rows]
+
+    def _search(self, query: str, limit: int) -> list[Application]:
+        q = query.strip()
+        digits = re.sub(r"[\s()+-]", "", q)
+        if digits.isdigit():
+            # 10 цифр — і ІПН, і мобільний 0XXXXXXXXX; шукаємо обидва за індексами
+            where, params = "tax_id = ?", (digits,)
+            if len(digits) >= 9:
+                where, params = "tax_id = ? OR phone_key = ?", (digits, phone_key(digits))
+            return self._select(where, params, limit)
+        if q.startswith("@"):
+            return self._select("sender = ?", (q[1:].lower(),), limit)
+        key = name_key(q)
+        # префікс ПІБ через діапазон — так SQLite бере індекс, а не сканує таблицю
+        where, params = "(name_key >= ? AND name_key < ?)", (key, key + "\uffff")
+        if self.fts and _fts_query(q):
+            # id росте разом із часом відправки: FTS віддає найновіші збіги без сортування всіх
+            where += (" OR id IN (SELECT rowid FROM applications_fts WHERE applications_fts MATCH ? "
+                      "ORDER BY rowid DESC LIMIT ?)")
+            params += (_fts_query(q), limit)
+        elif not self.fts:
+            where += " OR product LIKE ? OR shop_addr LIKE ?"
+            params += (f"%{q}%", f"%{q}%")
+        return self._select(where, params, limit)
+
+    async def find(self, query: str, limit: int = 10) -> list[Application]:
+        """ІПН/телефон (цифри), @відправник, початок ПІБ або слова з товару й адреси ТТ."""
+        return await asyncio.to_thread(self._search, query, limit)
+
+    async def by_tax_id(self, tax_id: str, limit: int = 3) -> list[Application]:
+        tax_id = re.sub(r"\s", "", tax_id)
+        if not tax_id:
+            return []
+        return await asyncio.to_thread(self._select, "tax_id = ?", (tax_id,), limit)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
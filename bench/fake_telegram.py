@@ -0,0 +1,202 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import Counter
+from typing import Callable
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+def _chat(chat_id: int) -> dict:
+    if chat_id > 0:
+        return {"id": chat_id, "type": "private", "first_name": f"Agent{chat_id}"}
+    return {"id": chat_id, "type": "supergroup", "title": f"Bench group {chat_id}"}
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"Agent{user_id}", "username": f"agent{user_id}"}
+
+
+def _json_param(params: dict, name: str):
+    raw = params.get(name)
+    return json.loads(raw) if isinstance(raw, str) and raw[:1] in "[{" else raw
+
+
+class FakeTelegram:
+    """Заглушка Bot API для навантажувальних тестів.
+
+    Роздає апдейти через ``getUpdates`` (long polling), ``getFile`` і самі
+    файли (детерміновані байти заданого розміру), на решту методів відповідає
+    правдоподібним результатом. Кожен виклик рахується в ``calls`` і
+    видається очікувачам ``expect()`` — так сценарій бачить відповіді бота.
+    """
+
+    def __init__(self, token: str):
+        self.token = token
+        self.calls: Counter[str] = Counter()
+        self._updates: list[dict] = []
+        self._new_updates = asyncio.Event()
+        self._update_id = 0
+        self._message_id = 1000
+        self._files: dict[str, int] = {}  # file_id -> розмір
+        self._waiters: list[tuple[Callable[[dict], bool], asyncio.Future]] = []
+        self.bytes_served = 0
+        self.members: set[tuple[int, int]] = set()  # (chat_id, user_id) для getChatMember
+
+    # ---------- вхідні апдейти ----------
+    def _next_message_id(self) -> int:
+        self._message_id += 1
+        return self._message_id
+
+    def add_file(self, file_id: str, size: int) -> dict:
+        self._files[file_id] = size
+        return {"file_id": file_id, "file_unique_id": "u" + file_id, "file_size": size}
+
+    def message(self, chat_id: int, user_id: int, text: str | None = None, photo: tuple[str, int] | None = None,
+                caption: str | None = None, reply_to: dict | None = None,
+                media_group_id: str | None = None) -> dict:
+        msg = {
+            "message_id": self._next_message_id(),
+            "date": int(time.time()),
+            "chat": _chat(chat_id),
+            "from": _user(user_id),
+        }
+        if text is not None:
+            msg["text"] = text
+            if text.startswith("/"):
+                msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        if photo is not None:
+            file_id, size = photo
+            msg["photo"] = [dict(self.add_file(file_id, size), width=1280, height=960)]
+        if caption is not None:
+            msg["caption"] = caption
+        if reply_to is not None:
+            msg["reply_to_message"] = reply_to
+        if media_group_id is not None:
+            msg["media_group_id"] = media_group_id
+        return msg
+
+    def push(self, message: dict) -> dict:
+        self._update_id += 1
+        self._updates.append({"update_id": self._update_id, "message": message})
+        self._new_updates.set()
+        return message
+
+    # ---------- відповіді бота ----------
+    def expect(self, pred: Callable[[dict], bool]) -> asyncio.Future:
+        """Future з першим викликом Bot API, для якого ``pred(call)`` істинний.
+
+        Реєструвати треба до того, як надіслати апдейт, що його викличе.
+        """
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append((pred, fut))
+        return fut
+
+    def _record(self, call: dict):
+        self.calls[call["method"]] += 1
+        for item in list(self._waiters):
+            pred, fut = item
+            if fut.done():
+                self._waiters.remove(item)
+            elif pred(call):
+                self._waiters.remove(item)
+                fut.set_result(call)
+                return
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset") or 0)
+        if offset:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit") or 100)
+        return self._updates[:limit]
+
+    def _bot_message(self, chat_id: int, text: str | None, message_id: int | None = None) -> dict:
+        msg = {
+            "message_id": message_id or self._next_message_id(),
+            "date": int(time.time()),
+            "chat": _chat(chat_id),
+            "from": BOT_USER,
+        }
+        if text is not None:
+            msg["text"] = text
+        return msg
+
+    async def _method(self, request: web.Request) -> web.Response:
+        if request.match_info["token"] != self.token:
+            return web.json_response({"ok": False, "error_code": 401, "description": "Unauthorized"}, status=401)
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        result: object = True
+        chat_id = int(params["chat_id"]) if "chat_id" in params else None
+        call = {"method": method, "chat_id": chat_id, "at": time.perf_counter(), "params": params}
+
+        if method == "getUpdates":
+            result = await self._get_updates(params)
+        elif method == "getMe":
+            result = BOT_USER
+        elif method == "getFile":
+            file_id = params["file_id"]
+            result = {
+                "file_id": file_id,
+                "file_unique_id": "u" + file_id,
+                "file_size": self._files.get(file_id, 0),
+                "file_path": f"files/{file_id}.jpg",
+            }
+        elif method == "getChatMember":
+            user_id = int(params["user_id"])
+            result = {"status": "member" if (chat_id, user_id) in self.members else "left", "user": _user(user_id)}
+        elif method == "sendMessage":
+            result = self._bot_message(chat_id, params.get("text"))
+            reply = _json_param(params, "reply_parameters") or {}
+            call["reply_to"] = int(reply.get("message_id") or params.get("reply_to_message_id") or 0)
+            call["message_id"] = result["message_id"]
+            call["text"] = params.get("text")
+        elif method == "editMessageText":
+            call["message_id"] = int(params["message_id"])
+            call["text"] = params.get("text")
+            result = self._bot_message(chat_id, params.get("text"), call["message_id"])
+
+        self._record(call)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _file(self, request: web.Request) -> web.StreamResponse:
+        file_id = request.match_info["path"].rsplit("/", 1)[-1].rsplit(".", 1)[0]
+        size = self._files.get(file_id)
+        if size is None:
+            raise web.HTTPNotFound()
+        self.calls["file"] += 1
+        resp = web.StreamResponse(headers={"Content-Length": str(size)})
+        await resp.prepare(request)
+        # детерміновані байти: той самий file_id — той самий вміст
+        block = hashlib.sha256(file_id.encode()).digest() * 2048
+        left = size
+        while left > 0:
+            piece = block[:left]
+            await resp.write(piece)
+            left -= len(piece)
+        self.bytes_served += size
+        await resp.write_eof()
+        return resp
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._file)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> tuple[web.AppRunner, str]:
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        port = runner.addresses[0][1]
+        return runner, f"http://{host}:{port}"
@@ -0,0 +1,289 @@
+"""Навантажувальний стенд: бот у окремому процесі проти заглушки Bot API і SMTP-синка.
+
+Приклади::
+
+    python bench/run.py wizard --agents 20 --files 3 --file-kb 300
+    python bench/run.py toemail --count 50 --groups 5
+    python bench/run.py mail --count 200
+    python bench/run.py all --json result.json
+
+Ліміти Telegram (TG_*) за замовчуванням зняті, щоб міряти сам бот;
+``--real-limits`` лишає типові значення, ``--env KEY=VALUE`` перекриває будь-що.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from fake_telegram import FakeTelegram
+from smtp_sink import SMTPSink
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123456:BENCH"
+REPLY_TIMEOUT = 60.0
+# методи, що не є реакцією на дії користувача
+BACKGROUND = {"getUpdates", "getMe", "setMyCommands", "deleteWebhook"}
+
+# у кожного агента свій ІПН, інакше майстер додає попередження про дубль
+WIZARD_ANSWERS = [
+    "bench-{uid}", "Київ, вул. Тестова, 1", "{uid:010d}", "+380501234567",
+    "Смартфон Bench 128GB чорний", "15000", "1500", "4",
+]
+
+
+# ---------- бот ----------
+def _bot_env(api_url: str, smtp_port: int, real_limits: bool, extra: dict) -> dict:
+    env = dict(
+        os.environ,
+        PYTHONUNBUFFERED="1",
+        BOT_TOKEN=TOKEN,
+        TELEGRAM_API_URL=api_url,
+        SMTP_HOST="127.0.0.1",
+        SMTP_PORT=str(smtp_port),
+        SMTP_SECURITY="none",
+        SMTP_USER="bench@example.com",
+        SMTP_PASS="bench",
+        MAIL_FROM="bench@example.com",
+        MAIL_TO="inbox@example.com",
+        WEBHOOK_URL="",
+        WEBHOOK_MODE="0",
+        METRICS_PORT="0",
+        ACCESS_CONFIG="",
+        ROUTES_CONFIG="",
+        ALLOWED_CHAT_ID="",
+        ALLOWED_CHAT_IDS="",
+        ALLOWED_USER_IDS="",
+        DIGEST_CHATS="",
+    )
+    if not real_limits:
+        env.update(TG_GLOBAL_RATE="1000000", TG_CHAT_RATE="1000000", TG_GROUP_PER_MIN="60000000")
+    env.update(extra)
+    return env
+
+
+class BotProcess:
+    def __init__(self, env: dict, workdir: str):
+        self.env = env
+        self.workdir = workdir
+        self.proc: asyncio.subprocess.Process | None = None
+        self.peak_rss = 0  # КБ
+        self._sampler: asyncio.Task | None = None
+
+    async def start(self):
+        log = open(os.path.join(self.workdir, "bot.log"), "wb")
+        self.proc = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT, "bot.py"),
+            cwd=self.workdir, env=self.env, stdout=log, stderr=log,
+        )
+        log.close()
+        self._sampler = asyncio.create_task(self._sample())
+
+    def _rss(self) -> int:
+        # VmHWM — пік RSS за життя процесу (Linux)
+        try:
+            with open(f"/proc/{self.proc.pid}/status") as fh:
+                for line in fh:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return 0
+
+    async def _sample(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, self._rss())
+            await asyncio.sleep(0.2)
+
+    async def stop(self):
+        self.peak_rss = max(self.peak_rss, self._rss())
+        if self._sampler:
+            self._sampler.cancel()
+        if self.proc.returncode is None:
+            self.proc.send_signal(signal.SIGINT)  # бот закриває чергу, пул і сховища у finally
+            try:
+                await asyncio.wait_for(self.proc.wait(), 30)
+            except asyncio.TimeoutError:
+                self.proc.kill()
+                await self.proc.wait()
+
+
+# ---------- сценарії ----------
+class Scenario:
+    def __init__(self, fake: FakeTelegram):
+        self.fake = fake
+        self.latencies: list[float] = []  # від тригера до "✅" у чаті
+        self.failures: Counter[str] = Counter()
+
+    async def say(self, chat_id: int, user_id: int, **kwargs) -> dict:
+        # повідомлення користувача в приват і наступна відповідь бота в тому ж чаті
+        fut = self.fake.expect(lambda c: c["method"] == "sendMessage" and c["chat_id"] == chat_id)
+        self.fake.push(self.fake.message(chat_id, user_id, **kwargs))
+        return await asyncio.wait_for(fut, REPLY_TIMEOUT)
+
+    async def trigger(self, message: dict) -> float:
+        """Надсилає тригер листа й чекає, поки бот відредагує "в черзі" на результат."""
+        chat_id = message["chat"]["id"]
+        box = {}
+
+        def queued(c: dict) -> bool:
+            if c["method"] == "sendMessage" and c["chat_id"] == chat_id and (
+                chat_id > 0 or c.get("reply_to") == message["message_id"]
+            ):
+                box["id"] = c["message_id"]
+                return True
+            return False
+
+        ack = self.fake.expect(queued)
+        done = self.fake.expect(lambda c: c["method"] == "editMessageText" and c["message_id"] == box.get("id"))
+        started = time.perf_counter()
+        self.fake.push(message)
+        try:
+            await asyncio.wait_for(ack, REPLY_TIMEOUT)
+            result = await asyncio.wait_for(done, REPLY_TIMEOUT)
+        finally:
+            ack.cancel()
+            done.cancel()
+        if "❌" in (result.get("text") or ""):
+            raise RuntimeError(result["text"])
+        return result["at"] - started
+
+    async def run_one(self, coro):
+        try:
+            self.latencies.append(await coro)
+        except Exception as e:
+            self.failures[type(e).__name__] += 1
+
+
+async def wizard(sc: Scenario, agents: int, files: int, file_kb: int):
+    async def agent(uid: int) -> float:
+        await sc.say(uid, uid, text="/zayavka")
+        for answer in WIZARD_ANSWERS:
+            await sc.say(uid, uid, text=answer.format(uid=uid))
+        for i in range(files):
+            await sc.say(uid, uid, photo=(f"w{uid}x{i}", file_kb * 1024))
+        return await sc.trigger(sc.fake.message(uid, uid, text="/done"))
+
+    await asyncio.gather(*(sc.run_one(agent(10_000 + n)) for n in range(agents)))
+
+
+async def toemail(sc: Scenario, count: int, groups: int, files: int, file_kb: int):
+    async def one(n: int) -> float:
+        group, uid = -1_000_000 - n % groups, 20_000 + n
+        if files:
+            origin = sc.fake.message(group, uid, photo=(f"r{n}", file_kb * 1024), caption=f"Фото до заявки {n}")
+        else:
+            origin = sc.fake.message(group, uid, text=f"Повідомлення {n} для пересилання")
+        sc.fake.push(origin)
+        return await sc.trigger(sc.fake.message(group, uid, text=f"/toemail bench-r{n}", reply_to=origin))
+
+    await asyncio.gather(*(sc.run_one(one(n)) for n in range(count)))
+
+
+async def mail_storm(sc: Scenario, count: int, groups: int):
+    async def one(n: int) -> float:
+        group, uid = -2_000_000 - n % groups, 30_000 + n
+        return await sc.trigger(sc.fake.message(group, uid, text=f"!mail bench-m{n} | Текст повідомлення {n}"))
+
+    await asyncio.gather(*(sc.run_one(one(n)) for n in range(count)))
+
+
+# ---------- звіт ----------
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarize(name: str, sc: Scenario, wall: float, calls: Counter, mails: int) -> dict:
+    ok = len(sc.latencies)
+    api = {m: n for m, n in calls.items() if m not in BACKGROUND and n}
+    return {
+        "scenario": name,
+        "submissions": ok,
+        "failures": dict(sc.failures),
+        "wall_sec": round(wall, 3),
+        "submissions_per_sec": round(ok / wall, 2) if wall else 0.0,
+        "latency_ms": {f"p{p}": round(percentile(sc.latencies, p) * 1000, 1) for p in (50, 95, 99)},
+        "api_calls_per_submission": round(sum(api.values()) / ok, 2) if ok else None,
+        "api_calls": api,
+        "mails": mails,
+    }
+
+
+def print_report(rows: list[dict], peak_rss_kb: int):
+    for r in rows:
+        lat = r["latency_ms"]
+        print(f"\n== {r['scenario']} ==")
+        print(f"  submissions     {r['submissions']}  (failures: {r['failures'] or 0})")
+        print(f"  throughput      {r['submissions_per_sec']}/s over {r['wall_sec']} s")
+        print(f"  latency ms      p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}")
+        print(f"  api calls/sub   {r['api_calls_per_submission']}  {r['api_calls']}")
+        print(f"  mails received  {r['mails']}")
+    print(f"\npeak RSS of bot: {peak_rss_kb / 1024:.1f} MB" if peak_rss_kb else "\npeak RSS of bot: n/a")
+
+
+async def main(args) -> int:
+    fake = FakeTelegram(TOKEN)
+    sink = SMTPSink()
+    runner, api_url = await fake.start()
+    smtp_port = await sink.start()
+    extra = dict(kv.split("=", 1) for kv in args.env)
+
+    with tempfile.TemporaryDirectory(prefix="tgmail-bench-") as workdir:
+        bot = BotProcess(_bot_env(api_url, smtp_port, args.real_limits, extra), workdir)
+        ready = fake.expect(lambda c: c["method"] == "getUpdates")
+        await bot.start()
+        try:
+            await asyncio.wait_for(ready, 30)
+        except asyncio.TimeoutError:
+            print("bot did not start; see log:\n" + open(os.path.join(workdir, "bot.log")).read(), file=sys.stderr)
+            await bot.stop()
+            return 1
+
+        plan = {
+            "wizard": lambda sc: wizard(sc, args.agents, args.files, args.file_kb),
+            "toemail": lambda sc: toemail(sc, args.count, args.groups, min(args.files, 1), args.file_kb),
+            "mail": lambda sc: mail_storm(sc, args.count, args.groups),
+        }
+        names = list(plan) if args.scenario == "all" else [args.scenario]
+        rows = []
+        try:
+            for name in names:
+                sc = Scenario(fake)
+                calls_before, mails_before = Counter(fake.calls), sink.messages
+                started = time.perf_counter()
+                await plan[name](sc)
+                wall = time.perf_counter() - started
+                rows.append(summarize(name, sc, wall, fake.calls - calls_before, sink.messages - mails_before))
+        finally:
+            await bot.stop()
+            await runner.cleanup()
+            await sink.stop()
+
+    print_report(rows, bot.peak_rss)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({"peak_rss_kb": bot.peak_rss, "scenarios": rows}, fh, ensure_ascii=False, indent=2)
+    return 0 if all(not r["failures"] for r in rows) else 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", choices=["wizard", "toemail", "mail", "all"])
+    parser.add_argument("--agents", type=int, default=20, help="паралельних агентів у майстрі")
+    parser.add_argument("--files", type=int, default=3, help="вкладень на заявку")
+    parser.add_argument("--file-kb", type=int, default=300, help="розмір кожного вкладення")
+    parser.add_argument("--count", type=int, default=50, help="повідомлень у сплеску /toemail чи !mail")
+    parser.add_argument("--groups", type=int, default=5, help="між скількома групами ділити сплеск")
+    parser.add_argument("--real-limits", action="store_true", help="не знімати ліміти TG_*")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="змінна для бота")
+    parser.add_argument("--json", help="куди записати результат")
+    sys.exit(asyncio.run(main(parser.parse_args())))
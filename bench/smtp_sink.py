@@ -0,0 +1,172 @@
+import argparse
+import asyncio
+import re
+from email.parser import BytesHeaderParser
+from email.policy import default as DEFAULT_POLICY
+from typing import Callable, Iterable
+
+
+class SMTPSink:
+    """Локальний SMTP-сервер, що приймає все і нікуди не пересилає.
+
+    Оголошує PIPELINING, CHUNKING, 8BITMIME і AUTH PLAIN/LOGIN (будь-який
+    пароль підходить), тож бот іде тим самим шляхом, що й на справжньому
+    сервері, тільки без TLS. Для кожного прийнятого листа викликається
+    ``on_message(subject, size)``. ``max_sessions`` імітує провайдера, що
+    відповідає 421 на зайві одночасні з'єднання, ``refuse`` — адреси, на
+    які RCPT отримує 550. З ``record=True`` синк зберігає команди клієнта
+    (``commands``) і прийняті листи (``received``: відправник, отримувачі,
+    тіло) — для тестів клієнта; ``drop()`` рве всі сесії, як сервер по таймауту.
+    """
+
+    def __init__(self, on_message: Callable[[str, int], None] | None = None,
+                 pipelining: bool = True, chunking: bool = True, max_sessions: int | None = None,
+                 refuse: Iterable[str] = (), record: bool = False):
+        self.on_message = on_message
+        self.pipelining = pipelining
+        self.chunking = chunking
+        self.messages = 0
+        self.bytes = 0
+        self.sessions = 0
+        self.max_sessions = max_sessions
+        self.active = 0
+        self.refuse = set(refuse)
+        self.record = record
+        self.commands: list[str] = []
+        self.received: list[tuple[str, list[str], bytes]] = []
+        self._writers: set[asyncio.StreamWriter] = set()
+        self._server: asyncio.Server | None = None
+
+    def _accept(self, data: bytes, mail_from: str = "", rcpts: list[str] = ()):
+        self.messages += 1
+        self.bytes += len(data)
+        if self.record:
+            self.received.append((mail_from, list(rcpts), data))
+        subject = BytesHeaderParser(policy=DEFAULT_POLICY).parsebytes(data).get("subject", "")
+        if self.on_message:
+            self.on_message(str(subject), len(data))
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def reply(line: str):
+            writer.write(line.encode() + b"\r\n")
+
+        if self.max_sessions is not None and self.active >= self.max_sessions:
+            reply("421 too many connections")
+            writer.close()
+            return
+        self.sessions += 1
+        self.active += 1
+        self._writers.add(writer)
+        reply("220 bench sink ready")
+        bdat: list[bytes] = []
+        mail_from, rcpts = "", []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                cmd = line.decode("utf-8", "replace").rstrip("\r\n")
+                verb = cmd.split(" ", 1)[0].upper()
+                if self.record:
+                    self.commands.append(cmd)
+                if verb in ("EHLO", "HELO"):
+                    ext = ["bench"]
+                    if self.pipelining:
+                        ext.append("PIPELINING")
+                    if self.chunking:
+                        ext.append("CHUNKING")
+                    ext += ["8BITMIME", "SIZE 0", "AUTH PLAIN LOGIN"]
+                    for item in ext[:-1]:
+                        reply(f"250-{item}")
+                    reply(f"250 {ext[-1]}")
+                elif verb == "AUTH":
+                    if cmd.upper().split()[1:2] == ["LOGIN"]:
+                        for _ in range(2):
+                            reply("334 ")
+                            await writer.drain()
+                            await reader.readline()
+                    reply("235 ok")
+                elif verb == "MAIL":
+                    mail_from, rcpts = _address(cmd), []
+                    reply("250 ok")
+                elif verb == "RCPT":
+                    if _address(cmd) in self.refuse:
+                        reply("550 no such user")
+                    else:
+                        rcpts.append(_address(cmd))
+                        reply("250 ok")
+                elif verb == "DATA":
+                    if not rcpts:
+                        reply("554 no valid recipients")
+                        continue
+                    reply("354 go ahead")
+                    await writer.drain()
+                    body = []
+                    while True:
+                        chunk = await reader.readline()
+                        if chunk == b".\r\n" or not chunk:
+                            break
+                        # dot-stuffing: точка на початку рядка — завжди доданий клієнтом
+                        body.append(chunk[1:] if chunk.startswith(b".") else chunk)
+                    self._accept(b"".join(body), mail_from, rcpts)
+                    reply("250 queued")
+                elif verb == "BDAT":
+                    parts = cmd.split()
+                    bdat.append(await reader.readexactly(int(parts[1])))
+                    if len(parts) > 2 and parts[2].upper() == "LAST":
+                        self._accept(b"".join(bdat), mail_from, rcpts)
+                        bdat = []
+                    reply("250 ok")
+                elif verb in ("NOOP", "RSET"):
+                    reply("250 ok")
+                elif verb == "QUIT":
+                    reply("221 bye")
+                    await writer.drain()
+                    break
+                else:
+                    reply("502 not implemented")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.active -= 1
+            self._writers.discard(writer)
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    def drop(self):
+        for writer in list(self._writers):
+            writer.close()
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+def _address(cmd: str) -> str:
+    match = re.search(r"<([^>]*)>", cmd)
+    return match.group(1) if match else ""
+
+
+async def _serve(host: str, port: int, max_sessions: int | None):
+    sink = SMTPSink(lambda subject, size: print(f"{size:>10}  {subject}"), max_sessions=max_sessions)
+    port = await sink.start(host, port)
+    print(f"SMTP sink on {host}:{port} (security none)")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    # окремий синк для ручних замірів, напр. smtp_test.py --security none
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--max-sessions", type=int)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args.host, args.port, args.max_sessions))
+    except KeyboardInterrupt:
+        pass
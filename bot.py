@@ -1,35 +1,67 @@
 import asyncio
+import json
 import os
-import ssl
-import smtplib
 import mimetypes
+import signal
 import time
+import weakref
+from dataclasses import dataclass
 from email.message import EmailMessage
-from email.utils import make_msgid, formatdate
+from email.policy import SMTP as SMTP_POLICY
+from email.utils import make_msgid, formatdate, getaddresses, parseaddr
+from html import escape
 
+from aiohttp import web
 from aiogram import Bot, Dispatcher, F
-from aiogram.filters import Command, CommandStart
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.filters import Command, CommandStart, StateFilter
 from aiogram.types import (
     Message, CallbackQuery,
-    BotCommand, BotCommandScopeAllGroupChats,
+    BotCommand, BotCommandScopeAllGroupChats, BotCommandScopeAllPrivateChats,
     InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardRemove
 )
 from aiogram.enums import ChatType
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
 from dotenv import load_dotenv
 
+import cpu_pool
+from access import AccessControl, compile_policy
+from archive import Application, ApplicationArchive
+import imaging
+import metrics
+from mail_queue import MailQueue, SENT, DEAD
+from smtp_pool import SMTPPool
+from digest import DigestBuffer, DigestItem, DigestRule, parse_rules
+from file_cache import FileCache
+from ledger import BUSY, DONE, SubmissionLedger, submission_key
+from mime_stream import StreamingMessage
+from packing import pack, part_size, part_subject, zip_documents
+from routing import DEFAULT, DeliveryError, Destination, load_routing
+from spool import AttachmentSpool
+from sqlite_storage import SQLiteStorage
+from tg_scheduler import OutboundScheduler
+from ttl_map import TTLMap
+
 # ---------- ENV ----------
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# інший Bot API сервер (local Bot API або заглушка з bench/); порожньо — api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL") or None
 ALLOWED_CHAT_ID = int(os.getenv("ALLOWED_CHAT_ID", "0") or "0")
 ALLOWED_CHAT_IDS = [
     int(x) for x in os.getenv("ALLOWED_CHAT_IDS", "").split(",")
     if x.strip().lstrip("-").isdigit()
 ]
 ALLOWED_USER_IDS = [int(x) for x in os.getenv("ALLOWED_USER_IDS", "").split(",") if x.strip().isdigit()]
+# якщо задано — правила доступу беруться з цього JSON і перечитуються на льоту (зміна файлу / SIGHUP)
+ACCESS_CONFIG = os.getenv("ACCESS_CONFIG") or None
+ACCESS_RELOAD_SEC = float(os.getenv("ACCESS_RELOAD_SEC", "5"))
+# скільки пам'ятати, чи є користувач агентом (членство в дозволених групах) для /find
+AGENT_CACHE_SEC = float(os.getenv("AGENT_CACHE_SEC", "300"))
 
 SMTP_HOST = os.getenv("SMTP_HOST", "smtp.ukr.net")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
@@ -37,41 +69,178 @@ SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASS = os.getenv("SMTP_PASS")
 MAIL_TO    = os.getenv("MAIL_TO", SMTP_USER)
 MAIL_FROM  = os.getenv("MAIL_FROM", SMTP_USER)
+SMTP_SECURITY   = os.getenv("SMTP_SECURITY") or None  # ssl / starttls / none; типово — за портом
+SMTP_TLS_VERIFY = os.getenv("SMTP_TLS_VERIFY", "1") != "0"
+SMTP_POOL_SIZE  = int(os.getenv("SMTP_POOL_SIZE", "4"))
+MAIL_MAX_BYTES  = int(os.getenv("MAIL_MAX_MB", "0") or "0") * 2**20  # 0 -> SIZE з EHLO сервера
+MAIL_ZIP_DOCS   = os.getenv("MAIL_ZIP_DOCS", "0") == "1"  # стискати документи (не фото/відео) у zip
+SMTP_IDLE_TTL   = float(os.getenv("SMTP_IDLE_TTL", "60"))    # сек, після цього сесію перевідкриваємо
+SMTP_NOOP_AFTER = float(os.getenv("SMTP_NOOP_AFTER", "10"))  # сек простою, після яких перевіряємо NOOP
+# JSON з адресатами (кожен зі своїм SMTP) і правилами чат/тип/адреса ТТ -> адресати;
+# без файлу все йде на MAIL_TO через SMTP_* вище
+ROUTES_CONFIG   = os.getenv("ROUTES_CONFIG") or None
+
+MAIL_QUEUE_DB     = os.getenv("MAIL_QUEUE_DB", "mail_queue.sqlite3")
+MAIL_SPOOL_DIR    = os.getenv("MAIL_SPOOL_DIR", "spool/outbox")
+MAIL_WORKERS      = int(os.getenv("MAIL_WORKERS", "2"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "8"))
+MAIL_RETRY_BASE   = float(os.getenv("MAIL_RETRY_BASE", "5"))    # сек, далі x2 на кожну спробу
+MAIL_RETRY_MAX    = float(os.getenv("MAIL_RETRY_MAX", "900"))
+
+FSM_DB         = os.getenv("FSM_DB", "fsm.sqlite3")
+FSM_TTL_SEC    = float(os.getenv("FSM_TTL_SEC", str(6 * 3600)))  # покинуті чернетки заявок
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "1024"))
+
+# журнал відправлених заявок: повторне "Відправити" / /done не дає другого листа
+SUBMIT_DB         = os.getenv("SUBMIT_DB", "submissions.sqlite3")
+SUBMIT_WINDOW_SEC = float(os.getenv("SUBMIT_WINDOW_SEC", "600"))  # повтори в цьому вікні — одразу з пам'яті
+SUBMIT_KEEP_DAYS  = float(os.getenv("SUBMIT_KEEP_DAYS", "30"))
+
+# архів відправлених заявок: /find і попередження про повторний ІПН у майстрі
+ARCHIVE_DB = os.getenv("ARCHIVE_DB", "archive.sqlite3")
+FIND_LIMIT = int(os.getenv("FIND_LIMIT", "10"))
+
+ATTACH_SPOOL_DIR     = os.getenv("ATTACH_SPOOL_DIR", "spool/sessions")
+ATTACH_SESSION_QUOTA = int(os.getenv("ATTACH_SESSION_QUOTA_MB", "100")) * 2**20
+ATTACH_GLOBAL_QUOTA  = int(os.getenv("ATTACH_GLOBAL_QUOTA_MB", "2048")) * 2**20
+ATTACH_TTL_SEC       = float(os.getenv("ATTACH_TTL_SEC", str(6 * 3600)))  # незавершені заявки
+FILE_CACHE_DIR       = os.getenv("FILE_CACHE_DIR", "spool/cache")
+FILE_CACHE_MAX_BYTES = int(os.getenv("FILE_CACHE_MAX_MB", "512")) * 2**20
+FILE_CACHE_TTL_SEC   = float(os.getenv("FILE_CACHE_TTL_SEC", str(24 * 3600)))
+FILE_CACHE_MEM_BYTES = int(os.getenv("FILE_CACHE_MEM_MB", "8")) * 2**20
+IMAGE_MAX_SIDE       = int(os.getenv("IMAGE_MAX_SIDE", "0"))  # 0 -> фото заявки не чіпаємо (Pillow з requirements.txt)
+IMAGE_JPEG_QUALITY   = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+FETCH_CONCURRENCY    = int(os.getenv("FETCH_CONCURRENCY", "4"))  # одночасних завантажень з Telegram
+ALBUM_CACHE_SIZE     = int(os.getenv("ALBUM_CACHE_SIZE", "500"))  # скільки останніх альбомів пам'ятаємо
+ALBUM_TTL_SEC        = float(os.getenv("ALBUM_TTL_SEC", "3600"))  # і як довго після останнього фото
+PENDING_MAX          = int(os.getenv("PENDING_MAX", "10000"))  # ліміт "міток очікування" /start
+TTL_REAP_SEC         = float(os.getenv("TTL_REAP_SEC", "30"))  # як часто прибирати прострочені короткочасні дані
+ALBUM_DEBOUNCE_SEC   = float(os.getenv("ALBUM_DEBOUNCE_SEC", "0.8"))  # тиша, після якої альбом вважаємо повним
+
+# ліміти Bot API: ~30 повідомлень/с на бота, ~1/с у чат, ~20/хв у групу
+TG_GLOBAL_RATE    = float(os.getenv("TG_GLOBAL_RATE", "30"))
+TG_CHAT_RATE      = float(os.getenv("TG_CHAT_RATE", "1"))
+TG_GROUP_PER_MIN  = float(os.getenv("TG_GROUP_PER_MIN", "20"))
+TG_RETRY_AFTER_MAX = int(os.getenv("TG_RETRY_AFTER_MAX", "3"))  # повторів після flood control
 
-bot = Bot(token=BOT_TOKEN)
-dp  = Dispatcher(storage=MemoryStorage())
+# дайджест: !mail (і за бажанням /toemail) з цих чатів збираються в один лист
+# формат DIGEST_CHATS: "-100123,-100456=60/20/512" (після "=" — сек/штук/КБ для чату)
+DIGEST_DEFAULT = DigestRule(
+    float(os.getenv("DIGEST_WINDOW_SEC", "300")),
+    int(os.getenv("DIGEST_MAX_ITEMS", "30")),
+    int(os.getenv("DIGEST_MAX_KB", "5120")) * 1024,
+)
+DIGEST_RULES   = parse_rules(os.getenv("DIGEST_CHATS", ""), DIGEST_DEFAULT)
+DIGEST_TOEMAIL = os.getenv("DIGEST_TOEMAIL", "0") == "1"
+
+# webhook-режим: WEBHOOK_URL — публічна адреса без шляху, за нею реєструємо вебхук;
+# WEBHOOK_MODE=1 без URL — лише підняти сервер (локально слати записані Update POST-ом)
+WEBHOOK_URL     = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_MODE    = bool(WEBHOOK_URL) or os.getenv("WEBHOOK_MODE", "0") == "1"
+WEBHOOK_PATH    = os.getenv("WEBHOOK_PATH", "/tg/webhook")
+WEBHOOK_SECRET  = os.getenv("WEBHOOK_SECRET") or None
+WEBAPP_HOST     = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT     = int(os.getenv("WEBAPP_PORT") or os.getenv("PORT") or "8080")
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "64"))  # апдейтів в обробці одночасно
+
+# Prometheus: GET /metrics на окремому порту (0 — вимкнено)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# ---------- METRICS ----------
+# на гарячому шляху — лише інкременти в dict; gauge рахуються під час scrape
+HANDLER_SECONDS = metrics.REGISTRY.histogram(
+    "tgmail_handler_seconds", "Час обробки апдейту хендлером", ["handler"])
+ERRORS = metrics.REGISTRY.counter(
+    "tgmail_errors_total", "Помилки за місцем і типом винятку", ["where", "type"])
+FETCH_SECONDS = metrics.REGISTRY.histogram(
+    "tgmail_fetch_seconds", "Завантаження вкладення з Telegram у спул")
+FETCH_BYTES = metrics.REGISTRY.histogram(
+    "tgmail_fetch_bytes", "Розмір завантаженого вкладення", buckets=metrics.SIZE_BUCKETS)
+SMTP_PHASE_SECONDS = metrics.REGISTRY.histogram(
+    "tgmail_smtp_phase_seconds", "Фази SMTP: connect, tls, auth, transfer", ["phase"])
+DEST_SECONDS = metrics.REGISTRY.histogram(
+    "tgmail_destination_seconds", "Доставка листа (усіх частин) одному адресату", ["destination"])
+DEST_FAILURES = metrics.REGISTRY.counter(
+    "tgmail_destination_failures_total", "Невдалі доставки за адресатом і типом винятку",
+    ["destination", "type"])
+MAIL_SECONDS = metrics.REGISTRY.histogram(
+    "tgmail_mail_send_seconds", "Повна відправка листа (усіх частин) воркером черги")
+SAFE_DEL_SUPPRESSED = metrics.REGISTRY.counter(
+    "tgmail_delete_suppressed_total", "Проковтнуті помилки видалення повідомлень", ["method"])
+metrics.REGISTRY.gauge(
+    "tgmail_wizards_active", "Незавершені чернетки за станом FSM",
+    lambda: fsm_storage.count_states(), ["state"])
+metrics.REGISTRY.gauge(
+    "tgmail_attachment_bytes", "Байти вкладень у спулі чернеток", lambda: attach_spool.total)
+metrics.REGISTRY.gauge(
+    "tgmail_file_cache", "Стан кешу файлів Telegram", lambda: file_cache.stats(), ["stat"])
+
+bot = Bot(
+    token=BOT_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None,
+)
+bot.session.middleware(OutboundScheduler(
+    global_rate=TG_GLOBAL_RATE, chat_rate=TG_CHAT_RATE,
+    group_per_min=TG_GROUP_PER_MIN, max_retries=TG_RETRY_AFTER_MAX,
+))
+fsm_storage = SQLiteStorage(FSM_DB, ttl=FSM_TTL_SEC, cache_size=FSM_CACHE_SIZE)
+dp  = Dispatcher(storage=fsm_storage)
+ledger = SubmissionLedger(SUBMIT_DB, window=SUBMIT_WINDOW_SEC, keep_sec=SUBMIT_KEEP_DAYS * 86400)
+archive = ApplicationArchive(ARCHIVE_DB)
+file_cache = FileCache(FILE_CACHE_DIR, FILE_CACHE_MAX_BYTES, FILE_CACHE_TTL_SEC, mem_max_bytes=FILE_CACHE_MEM_BYTES)
+attach_spool = AttachmentSpool(
+    ATTACH_SPOOL_DIR, ATTACH_SESSION_QUOTA, ATTACH_GLOBAL_QUOTA, ATTACH_TTL_SEC, cache=file_cache
+)
+routing = load_routing(ROUTES_CONFIG, Destination(
+    DEFAULT, (MAIL_TO,) if MAIL_TO else (), MAIL_FROM or "",
+    SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, SMTP_SECURITY, SMTP_TLS_VERIFY,
+))
+# пул сесій на кожен SMTP-сервер+логін; адресати на тому ж сервері ділять пул
+_smtp_pools: dict[tuple, SMTPPool] = {}
+
+def _pool_for(dest: Destination) -> SMTPPool:
+    pool = _smtp_pools.get(dest.server)
+    if pool is None:
+        pool = _smtp_pools[dest.server] = SMTPPool(
+            dest.host, dest.port, dest.user, dest.password,
+            max_size=SMTP_POOL_SIZE, idle_ttl=SMTP_IDLE_TTL, noop_after=SMTP_NOOP_AFTER,
+            verify_tls=dest.verify_tls, security=dest.security,
+            on_timing=lambda phase, sec: SMTP_PHASE_SECONDS.observe(sec, phase),
+        )
+    return pool
 
 BOT_USERNAME: str | None = None  # підставляємо в main()
 
 # --- короткочасні "мітки очікування" для автозапуску у приваті ---
-# user_id -> unix_deadline
-PENDING_START: dict[int, float] = {}
+# user_id -> id групи, з якої запустили /zayavka (для маршрутизації), поки не мине PENDING_TTL_SEC
 PENDING_TTL_SEC = 5 * 60  # 5 хвилин
+PENDING_START: TTLMap[int, int] = TTLMap(PENDING_TTL_SEC, max_size=PENDING_MAX)
 
-# ---------- HELPERS ----------
-def _allowed(message: Message) -> bool:
-    if message.chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
-        return False
-    allowed_ids = set(ALLOWED_CHAT_IDS)
-    if ALLOWED_CHAT_ID:
-        allowed_ids.add(ALLOWED_CHAT_ID)
-    if allowed_ids and message.chat.id not in allowed_ids:
-        return False
-    if ALLOWED_USER_IDS:
-        return message.from_user and message.from_user.id in ALLOWED_USER_IDS
-    return True
-
-def _allowed_for_wizard(message: Message) -> bool:
-    return (message.chat.type == ChatType.PRIVATE) or _allowed(message)
+# --- останні альбоми в групах: Bot API не віддає інші повідомлення media group ---
+# (chat_id, media_group_id) -> повідомлення альбому
+ALBUMS: TTLMap[tuple[int, str], dict[int, Message]] = TTLMap(ALBUM_TTL_SEC, max_size=ALBUM_CACHE_SIZE)
+
+_fetch_sem = asyncio.Semaphore(FETCH_CONCURRENCY)
 
+# альбоми, що зараз збираються у кроці вкладень: (chat_id, user_id, media_group_id) -> повідомлення
+_album_batches: dict[tuple[int, int, str], list[Message]] = {}
+# локи на власника заявки; зникають самі, коли ніхто їх не тримає
+_owner_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# ---------- HELPERS ----------
 def _subject(prefix: str, theme: str, m: Message) -> str:
     user = f"{m.from_user.full_name} (@{m.from_user.username})" if m.from_user else "Unknown"
     return f"[TG→Mail] {prefix} — {theme.strip()} — від {user}"
 
-def _html_with_meta(text: str, m: Message, note: str = "") -> str:
+def _meta(m: Message) -> tuple[str, str, str]:
     chat_title = m.chat.title or str(m.chat.id)
     user = f"{m.from_user.full_name} (@{m.from_user.username})" if m.from_user else "Unknown"
     permalink = f"https://t.me/c/{str(m.chat.id)[4:]}/{m.message_id}" if str(m.chat.id).startswith("-100") else "N/A"
+    return chat_title, user, permalink
+
+def _html_with_meta(text: str, m: Message, note: str = "") -> str:
+    chat_title, user, permalink = _meta(m)
     return f"""
     <html><body>
       <div style="font-family:Arial,Helvetica,sans-serif; font-size:16px; color:#000; line-height:1.5;">
@@ -94,47 +263,336 @@ def _html_plain(text: str) -> str:
     </body></html>
     """
 
-def send_email(subject: str, html_body: str, attachments: list[tuple[str, bytes]] = None):
+def _html_digest(items: list[DigestItem]) -> str:
+    rows = "".join(
+        f"""
+        <tr>
+          <td>{n}</td>
+          <td>{time.strftime("%d.%m %H:%M", time.localtime(it.at))}</td>
+          <td>{it.sender}</td>
+          <td>{it.theme}</td>
+          <td><pre style="white-space:pre-wrap; font-family:inherit; margin:0;">{it.text}</pre></td>
+          <td>{it.permalink}{f" (вкладень: {len(it.attachments)})" if it.attachments else ""}</td>
+        </tr>"""
+        for n, it in enumerate(items, 1)
+    )
+    return f"""
+    <html><body>
+      <div style="font-family:Arial,Helvetica,sans-serif; font-size:16px; color:#000; line-height:1.5;">
+        <p><b>Чат:</b> {items[0].chat_title}</p>
+        <p><b>Повідомлень у дайджесті:</b> {len(items)}</p>
+        <hr/>
+        <table border="1" cellpadding="6" cellspacing="0" style="border-collapse:collapse; font-size:14px;">
+          <tr><th>#</th><th>Час</th><th>Відправник</th><th>Тема</th><th>Текст</th><th>Посилання</th></tr>{rows}
+        </table>
+      </div>
+    </body></html>
+    """
+
+def _build_message(subject: str, html_body: str, attachments: list, msgid: str,
+                   references: list[str]) -> StreamingMessage:
+    # From і To не ставимо: лист рендериться один раз, адресат дописує свої через _dest_headers
     msg = EmailMessage()
     msg["Subject"] = subject
-    msg["From"] = MAIL_FROM
-    msg["To"] = MAIL_TO
     msg["Date"] = formatdate(localtime=True)
-    msg["Message-ID"] = make_msgid()
+    msg["Message-ID"] = msgid
+    if references:
+        msg["In-Reply-To"] = references[-1]
+        msg["References"] = " ".join(references)
     msg.set_content("Це HTML-лист.")
     msg.add_alternative(html_body, subtype="html")
 
-    for filename, data in (attachments or []):
+    # вкладення кодуються в base64 частинами прямо в сокет, а не цілим листом у пам'яті
+    stream = StreamingMessage(msg)
+    for att in attachments:
+        filename, source = (att["name"], att) if isinstance(att, dict) else att
         ctype, _ = mimetypes.guess_type(filename)
         if ctype is None:
             ctype = "application/octet-stream"
         maintype, subtype = ctype.split("/", 1)
-        msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=filename)
+        stream.add_attachment(source, maintype=maintype, subtype=subtype, filename=filename)
+    return stream
+
+def _att_size(att) -> tuple[str, int]:
+    if isinstance(att, dict):
+        return att["name"], os.path.getsize(att["path"])
+    return att[0], len(att[1])
+
+def _dest_headers(dest: Destination) -> bytes:
+    # From — свій у кожного адресата: інший провайдер не прийме (DMARC) чужу адресу відправника
+    msg = EmailMessage()
+    if dest.mail_from:
+        msg["From"] = dest.mail_from
+    msg["To"] = ", ".join(dest.to)
+    return msg.as_bytes(policy=SMTP_POLICY).rstrip(b"\r\n") + b"\r\n"
+
+async def _plan_parts(subject: str, html_body: str, attachments: list, pool: SMTPPool) -> list[list[int]]:
+    everything = [list(range(len(attachments)))]
+    limit = MAIL_MAX_BYTES or await pool.message_size_limit()
+    if not limit or not attachments:
+        return everything
+    sizes = [part_size(*_att_size(a)) for a in attachments]
+    # запас під суфікс "частина i/n" і заголовки In-Reply-To/References
+    base = _build_message(subject, html_body, [], make_msgid(), []).size + 1024
+    capacity = int(limit * 0.97) - base
+    if sum(sizes) <= capacity:
+        return everything
+    return pack(sizes, capacity)
+
+async def send_email(subject: str, html_body: str, attachments: list[tuple[str, bytes] | dict] = None,
+                     progress: dict | None = None, routes: list[str] | None = None):
+    # progress (з черги) пам'ятає план розбиття й відправлені частини між спробами
+    progress = {} if progress is None else progress
+    try:
+        with MAIL_SECONDS.time():
+            await _send_parts(subject, html_body, attachments, progress, routes or [DEFAULT])
+    except Exception as e:
+        ERRORS.inc("send_email", type(e).__name__)
+        raise
+
+async def _send_parts(subject: str, html_body: str, attachments: list, progress: dict, routes: list[str]):
+    files = progress.get("files")
+    if files is None:
+        files = list(attachments or [])
+        if MAIL_ZIP_DOCS:
+            files = await zip_documents(files)
+        progress["files"] = files
+    # план розбиття — свій у кожного адресата (SIZE серверів різний), але адресати
+    # з однаковим планом отримують ті самі відрендерені частини з тими самими Message-ID
+    plans = progress.setdefault("plans", {})
+    msgids = progress.setdefault("msgids", {})
+    # скільки частин уже прийняв кожен адресат; повтор із черги шле лише решту
+    delivered = progress.setdefault("delivered", {})
 
-    if SMTP_PORT == 465:
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, context=context) as s:
-            s.login(SMTP_USER, SMTP_PASS)
-            s.send_message(msg)
+    parts: dict[tuple[str, int], StreamingMessage] = {}
+
+    def part(key: str, plan: list[list[int]], i: int) -> StreamingMessage:
+        if (key, i) not in parts:
+            ids = msgids.setdefault(key, [make_msgid() for _ in plan])
+            parts[key, i] = _build_message(
+                part_subject(subject, i, len(plan)), html_body, [files[j] for j in plan[i]], ids[i], ids[:i]
+            )
+        return parts[key, i]
+
+    async def deliver(name: str):
+        dest = routing.destinations.get(name)
+        if dest is None:
+            raise LookupError(f"невідомий адресат {name!r}")
+        pool = _pool_for(dest)
+        rcpts = [addr for _, addr in getaddresses(list(dest.to)) if addr]
+        prefix = _dest_headers(dest)
+        with DEST_SECONDS.time(name):
+            plan = plans.get(name)
+            if plan is None:
+                plan = plans[name] = await _plan_parts(subject, html_body, files, pool)
+            key = json.dumps(plan)
+            for i in range(delivered.get(name, 0), len(plan)):
+                stream = part(key, plan, i)
+                # сесію беремо з пулу — без нового TCP/TLS/AUTH на кожен лист
+                await pool.sendmail(
+                    parseaddr(dest.mail_from)[1], rcpts, lambda conn: stream.chunks(prefix), stream.size + len(prefix)
+                )
+                delivered[name] = i + 1
+
+    # адресати паралельно: повільний сервер не затримує інших
+    results = await asyncio.gather(*(deliver(name) for name in routes), return_exceptions=True)
+    failures = {name: r for name, r in zip(routes, results) if isinstance(r, BaseException)}
+    for name, e in failures.items():
+        DEST_FAILURES.inc(name, type(e).__name__)
+    if failures:
+        raise DeliveryError(failures, [n for n in routes if n not in failures])
+
+# ---------- OUTBOX ----------
+QUEUED_TEXT = "⏳ Поставлено в чергу на відправку."
+
+async def _mail_result(job_id: int, notify: dict, error: str | None):
+    if error is None:
+        text, parse_mode = notify["text"], notify.get("parse_mode")
     else:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
-            s.starttls()
-            s.login(SMTP_USER, SMTP_PASS)
-            s.send_message(msg)
-
-async def _fetch(file_id: str, name: str) -> tuple[str, bytes]:
-    f = await bot.get_file(file_id)
-    file = await bot.download_file(f.file_path)
-    data = file.read()
-    return name, data
-
-async def _safe_del(chat_id: int, message_id: int | None):
-    if not message_id:
+        text, parse_mode = f"❌ Помилка надсилання (лист #{job_id}): {error}", None
+    try:
+        await bot.edit_message_text(
+            text, chat_id=notify["chat_id"], message_id=notify["message_id"], parse_mode=parse_mode
+        )
+    except Exception:
+        await bot.send_message(notify["chat_id"], text, parse_mode=parse_mode, disable_notification=True)
+
+mail_queue = MailQueue(
+    MAIL_QUEUE_DB, MAIL_SPOOL_DIR, send_email, on_result=_mail_result,
+    workers=MAIL_WORKERS, max_attempts=MAIL_MAX_ATTEMPTS,
+    base_delay=MAIL_RETRY_BASE, max_delay=MAIL_RETRY_MAX,
+)
+
+# тип елемента дайджесту -> тип листа для маршрутизації
+_DIGEST_KINDS = {"MSG": "mail", "REPLY": "toemail"}
+
+async def _flush_digest(chat_id: int, items: list[DigestItem]):
+    subject = f"[TG→Mail] DIGEST — {items[0].chat_title} — {len(items)} повідомлень"
+    # дайджест іде туди ж, куди пішли б його !mail і /toemail; змішаний — в обидва маршрути
+    routes: dict[str, None] = {}
+    for kind in dict.fromkeys(_DIGEST_KINDS[it.kind] for it in items):
+        routes.update(dict.fromkeys(routing.resolve(chat_id, kind)))
+    try:
+        await mail_queue.put(
+            subject, _html_digest(items), [a for it in items for a in it.attachments],
+            routes=list(routes),
+        )
+    except Exception as e:
+        await bot.send_message(chat_id, f"❌ Помилка надсилання дайджесту: {e}", disable_notification=True)
+    finally:
+        for it in items:
+            if it.session:
+                attach_spool.release(it.session)
+
+digest = DigestBuffer(DIGEST_RULES, _flush_digest)
+
+def _digest_item(kind: str, theme: str, text: str, m: Message, attachments: list = None,
+                 session: str | None = None) -> DigestItem:
+    chat_title, user, permalink = _meta(m)
+    return DigestItem(kind, theme, text, chat_title, user, permalink, attachments or [], session)
+
+async def _queue_mail(ack, subject: str, html_body: str, attachments: list, done_text: str,
+                      parse_mode: str | None = None, routes: list[str] | None = None) -> int:
+    # 1) лист на диск, 2) миттєва відповідь "в черзі", 3) воркер відредагує її після відправки
+    job_id = await mail_queue.put(subject, html_body, attachments, routes=routes)
+    if routes and routes != [DEFAULT]:
+        names = ", ".join(routes)
+        done_text += f"\n📬 {escape(names) if parse_mode == 'HTML' else names}"
+    sent = await ack(QUEUED_TEXT)
+    notify = {"chat_id": sent.chat.id, "message_id": sent.message_id, "text": done_text, "parse_mode": parse_mode}
+    status = await mail_queue.attach_notify(job_id, notify)
+    if status == SENT:
+        await _mail_result(job_id, notify, None)
+    elif status == DEAD:
+        await _mail_result(job_id, notify, "не вдалося відправити")
+    return job_id
+
+# файл качається потоком у спул; у пам'яті лишається тільки handle
+async def _fetch(session: str, file_id: str, name: str, mime: str | None = None,
+                 size: int | None = None, unique_id: str | None = None) -> dict:
+    async with _fetch_sem:
+        started = time.perf_counter()
+        try:
+            handle = await attach_spool.download(bot, session, file_id, name, mime, size, unique_id)
+        except Exception as e:
+            ERRORS.inc("fetch", type(e).__name__)
+            raise
+        FETCH_SECONDS.observe(time.perf_counter() - started)
+        FETCH_BYTES.observe(handle["size"])
+        return handle
+
+def _message_files(m: Message) -> list[tuple[str, str, str | None, int | None, str]]:
+    # (file_id, ім'я, mime, розмір, file_unique_id) для всіх медіа у повідомленні
+    out = []
+    if m.photo:
+        ph = m.photo[-1]
+        out.append((ph.file_id, f"photo_{m.message_id}.jpg", "image/jpeg", ph.file_size, ph.file_unique_id))
+    if m.document:
+        d = m.document
+        out.append((d.file_id, d.file_name or f"document_{m.message_id}", d.mime_type, d.file_size,
+                    d.file_unique_id))
+    if m.voice:
+        v = m.voice
+        out.append((v.file_id, f"voice_{m.message_id}.ogg", v.mime_type, v.file_size, v.file_unique_id))
+    if m.audio:
+        a = m.audio
+        out.append((a.file_id, a.file_name or f"audio_{m.message_id}.mp3", a.mime_type, a.file_size,
+                    a.file_unique_id))
+    if m.video:
+        v = m.video
+        out.append((v.file_id, f"video_{m.message_id}.mp4", v.mime_type, v.file_size, v.file_unique_id))
+    if m.video_note:
+        vn = m.video_note
+        out.append((vn.file_id, f"videonote_{m.message_id}.mp4", "video/mp4", vn.file_size, vn.file_unique_id))
+    return out
+
+async def _fetch_all(session: str, messages: list[Message]) -> list[dict]:
+    # усі файли качаються паралельно (обмежено _fetch_sem), порядок — як у чаті
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(_fetch(session, *f))
+                for m in messages for f in _message_files(m)
+            ]
+    except ExceptionGroup as eg:
+        raise eg.exceptions[0]
+    return [t.result() for t in tasks]
+
+def _album_of(origin: Message) -> list[Message]:
+    if not origin.media_group_id:
+        return [origin]
+    msgs = dict(ALBUMS.get((origin.chat.id, origin.media_group_id), {}))
+    msgs[origin.message_id] = origin
+    return [msgs[k] for k in sorted(msgs)]
+
+def _spool_key(chat_id: int, user_id: int) -> str:
+    return f"z{chat_id}_{user_id}"
+
+# фото стискаються у фоні, поки агент заповнює решту; session -> задачі
+_optimizing: dict[str, set[asyncio.Task]] = {}
+
+def _optimize_later(session: str, handle: dict):
+    if not IMAGE_MAX_SIDE or not imaging.available() or handle.get("mime") != "image/jpeg":
+        return
+
+    async def run():
+        try:
+            new_size = await imaging.optimize_jpeg(handle["path"], IMAGE_MAX_SIDE, IMAGE_JPEG_QUALITY)
+        except Exception:
+            return  # не вдалося — відправимо оригінал
+        if new_size is not None:
+            attach_spool.resize(session, new_size - handle["size"])
+
+    tasks = _optimizing.setdefault(session, set())
+    task = _spawn(run())
+    tasks.add(task)
+
+    def done(t: asyncio.Task):
+        # скасовані й покинуті сесії не лишають по собі ключа
+        tasks.discard(t)
+        if not tasks and _optimizing.get(session) is tasks:
+            del _optimizing[session]
+
+    task.add_done_callback(done)
+
+# хендлери, що ще збирають вкладення (альбом чекає debounce і качає файли); session -> задачі
+_collecting: dict[str, set[asyncio.Task]] = {}
+
+async def _wait_collecting(session: str):
+    # /done і "Відправити" не читають files, поки не допрацюють усі збори вкладень
+    me = asyncio.current_task()
+    while pending := [t for t in _collecting.get(session, ()) if t is not me]:
+        await asyncio.wait(pending)
+
+async def _settle_files(session: str):
+    # перед відправкою дочікуємось стиснення, щоб у лист пішли вже менші файли
+    tasks = _optimizing.pop(session, None)
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _safe_del_many(chat_id: int, message_ids: list[int | None]):
+    ids = [i for i in message_ids if i]
+    if not ids:
         return
     try:
-        await bot.delete_message(chat_id, message_id)
+        await bot.delete_messages(chat_id, ids)
     except Exception:
-        pass
+        SAFE_DEL_SUPPRESSED.inc("deleteMessages")
+
+# фонові задачі (прибирання повідомлень тощо); тримаємо посилання, щоб їх не зібрав GC
+_bg_tasks: set[asyncio.Task] = set()
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _bg_tasks.add(task)
+    task.add_done_callback(_bg_tasks.discard)
+    return task
+
+def _owner_lock(key: str) -> asyncio.Lock:
+    lock = _owner_locks.get(key)
+    if lock is None:
+        lock = _owner_locks[key] = asyncio.Lock()
+    return lock
 
 # персоналізований deep-link у приват
 def _private_link_kb(owner_id: int) -> InlineKeyboardMarkup:
@@ -162,6 +620,121 @@ async def _ask_next(message: Message, state: FSMContext, html_text: str, with_se
     )
     await state.update_data(bot_q=sent.message_id, owner_id=owner_id)
 
+SUBMIT_REPEAT_TEXT = {
+    BUSY: "⏳ Заявка вже відправляється.",
+    DONE: "✅ Цю заявку вже відправлено.",
+}
+
+def _zayavka_texts(user, data: dict) -> tuple[str, str, str]:
+    # (тема, текст листа, підсумок для агента)
+    files = data.get("files", [])
+    subject = f"(заявка) {data.get('fullname','').strip()} mobiletrend.com.ua"
+    body_text = (
+        f"Заявка від @{user.username or user.full_name} (id: {user.id})\n"
+        f"ПІБ клієнта: {data.get('fullname','')}\n"
+        f"Адреса ТТ: {data.get('shop_addr','')}\n"
+        f"ІПН клієнта: {data.get('tax_id','')}\n"
+        f"Моб. телефон: {data.get('phone','')}\n"
+        f"Товар (повна назва): {data.get('product','')}\n"
+        f"Вартість товару: {data.get('price','')}\n"
+        f"Перший внесок: {data.get('downpay','')}\n"
+        f"Кількість платежів (Грейс): {data.get('grace','')}\n"
+        f"Кількість вкладень: {len(files)}\n"
+    )
+    summary = (
+        "✅ <b>Заявку відправлено на пошту.</b>\n\n"
+        "<b>Що відправлено:</b>\n"
+        f"• <b>ПІБ клієнта:</b> {data.get('fullname','')}\n"
+        f"• <b>Адреса ТТ:</b> {data.get('shop_addr','')}\n"
+        f"• <b>ІПН клієнта:</b> {data.get('tax_id','')}\n"
+        f"• <b>Моб. телефон:</b> {data.get('phone','')}\n"
+        f"• <b>Товар:</b> {data.get('product','')}\n"
+        f"• <b>Вартість товару:</b> {data.get('price','')}\n"
+        f"• <b>Перший внесок:</b> {data.get('downpay','')}\n"
+        f"• <b>Кількість платежів (Грейс):</b> {data.get('grace','')}\n"
+        f"• <b>Вкладень:</b> {len(files)}"
+    )
+    return subject, body_text, summary
+
+async def _submit_zayavka(chat_id: int, user, state: FSMContext, ack) -> str | None:
+    """Ставить чернетку в чергу; None — поставлено, BUSY/DONE — це повторний тригер."""
+    owner = _spool_key(chat_id, user.id)
+    await _wait_collecting(owner)
+    async with _owner_lock(owner):
+        # /done і ✅ можуть прийти майже разом: поки один чекав, другий уже відправив
+        # і очистив стан, а порожня чернетка дала б новий ключ і другий, порожній лист
+        if await state.get_state() != Zayavka.wait_attachments.state or ledger.recently_sent(owner):
+            return DONE
+        data = await state.get_data()
+    if not any(data.get(step.key) for step in WIZARD_STEPS):
+        return DONE
+    files = data.get("files", [])
+    key = submission_key(owner, {step.key: data.get(step.key, "") for step in WIZARD_STEPS}, files)
+    verdict = await ledger.begin(owner, key)
+    if verdict is not None:
+        return verdict
+    subject, body_text, summary = _zayavka_texts(user, data)
+    try:
+        await _settle_files(owner)
+        routes = routing.resolve(data.get("origin_chat") or chat_id, "zayavka", data.get("shop_addr", ""))
+        job_id = await _queue_mail(
+            ack, subject, _html_plain(body_text), files, summary, parse_mode="HTML", routes=routes
+        )
+    except BaseException:
+        ledger.abort(owner)
+        raise
+    await ledger.complete(owner, key, job_id)
+    try:
+        await archive.record(
+            user.id, user.username or user.full_name, data.get("origin_chat") or chat_id,
+            data, len(files), job_id, routes,
+        )
+    except Exception as e:
+        # лист уже в черзі — без запису в архіві заявка все одно піде
+        ERRORS.inc("archive", type(e).__name__)
+    return None
+
+def _archive_line(a: Application) -> str:
+    when = time.strftime("%d.%m.%Y %H:%M", time.localtime(a.sent_at))
+    return (
+        f"• <b>{escape(a.fullname)}</b> — {when}, від @{escape(a.sender)}\n"
+        f"  ІПН {escape(a.tax_id)}, тел. {escape(a.phone)}\n"
+        f"  {escape(a.product)}; ТТ: {escape(a.shop_addr)}"
+    )
+
+# ---------- ACCESS ----------
+# доступ перевіряється один раз на апдейт, до всіх хендлерів і до індексу альбомів
+access = AccessControl(
+    compile_policy(ALLOWED_CHAT_IDS + ([ALLOWED_CHAT_ID] if ALLOWED_CHAT_ID else []), ALLOWED_USER_IDS),
+    ACCESS_CONFIG,
+    agent_ttl=AGENT_CACHE_SEC,
+)
+dp.message.outer_middleware(access)
+
+# ---------- HANDLER METRICS ----------
+# inner-middleware: спрацьовує лише коли хендлер уже вибрано, тож ім'я відоме
+async def _observe_handler(handler, event, data: dict):
+    with HANDLER_SECONDS.time(data["handler"].callback.__name__):
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            ERRORS.inc("handler", type(e).__name__)
+            raise
+
+dp.message.middleware(_observe_handler)
+dp.callback_query.middleware(_observe_handler)
+
+# ---------- ALBUM INDEX ----------
+@dp.message.outer_middleware()
+async def remember_albums(handler, message: Message, data: dict):
+    if message.media_group_id and message.chat.type in (ChatType.GROUP, ChatType.SUPERGROUP):
+        key = (message.chat.id, message.media_group_id)
+        msgs = ALBUMS.get(key) or {}
+        msgs[message.message_id] = message
+        # перезапис продовжує життя альбому; понад ліміт витісняються найстаріші
+        ALBUMS[key] = msgs
+    return await handler(message, data)
+
 # ---------- STATES ----------
 class Zayavka(StatesGroup):
     wait_fullname = State()
@@ -178,13 +751,44 @@ class Zayavka(StatesGroup):
 @dp.message(Command("cancel"))
 async def cancel_cmd(message: Message, state: FSMContext):
     data = await state.get_data()
-    await _safe_del(message.chat.id, data.get("bot_q"))
     await state.clear()
+    if message.from_user:
+        attach_spool.release(_spool_key(message.chat.id, message.from_user.id))
     await message.reply(
         "❌ Скасовано. Можна почати знову командою /zayavka",
         reply_markup=ReplyKeyboardRemove(),
         disable_notification=True
     )
+    _spawn(_safe_del_many(message.chat.id, [data.get("bot_q")]))
+
+# /find стоїть до кроків майстра, тож працює і посеред заповнення
+@dp.message(Command("find"), F.chat.type == ChatType.PRIVATE)
+async def find_cmd(message: Message):
+    # у приват пише будь-хто, а в архіві — дані клієнтів
+    if not message.from_user or not await access.is_agent(bot, message.from_user.id):
+        await message.answer("⛔ Пошук заявок доступний лише агентам.", disable_notification=True)
+        return
+    query = message.text.split(" ", 1)[1].strip() if " " in message.text else ""
+    if not query:
+        await message.answer(
+            "🔎 /find ІПН, телефон, @агент, прізвище клієнта або слова з товару чи адреси ТТ",
+            disable_notification=True,
+        )
+        return
+    found = await archive.find(query, FIND_LIMIT)
+    if not found:
+        await message.answer("Нічого не знайдено.", disable_notification=True)
+        return
+    head = f"🔎 <b>Знайдено:</b> {len(found)}" + (" (найновіші)" if len(found) == FIND_LIMIT else "")
+    await message.answer(
+        head + "\n\n" + "\n\n".join(map(_archive_line, found)),
+        parse_mode="HTML", disable_notification=True,
+    )
+
+@dp.message(Command("find"))
+async def find_in_group(message: Message):
+    # дані клієнтів не світимо в групі
+    await message.reply("🔒 Пошук заявок — в особистих повідомленнях боту: /find …", disable_notification=True)
 
 @dp.callback_query(F.data.startswith("form:"))
 async def form_buttons(call: CallbackQuery, state: FSMContext):
@@ -201,49 +805,35 @@ async def form_buttons(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
 
     if action == "cancel":
-        await _safe_del(call.message.chat.id, data.get("bot_q"))
         await state.clear()
+        attach_spool.release(_spool_key(call.message.chat.id, owner_id))
         await call.message.answer("❌ Скасовано. Можна почати знову командою /zayavka", disable_notification=True)
         await call.answer()
+        _spawn(_safe_del_many(call.message.chat.id, [data.get("bot_q")]))
         return
 
     if action == "send":
-        files = data.get("files", [])
-        subject = f"(заявка) {data.get('fullname','').strip()} mobiletrend.com.ua"
-        body_text = (
-            f"Заявка від @{call.from_user.username or call.from_user.full_name} (id: {call.from_user.id})\n"
-            f"ПІБ клієнта: {data.get('fullname','')}\n"
-            f"Адреса ТТ: {data.get('shop_addr','')}\n"
-            f"ІПН клієнта: {data.get('tax_id','')}\n"
-            f"Моб. телефон: {data.get('phone','')}\n"
-            f"Товар (повна назва): {data.get('product','')}\n"
-            f"Вартість товару: {data.get('price','')}\n"
-            f"Перший внесок: {data.get('downpay','')}\n"
-            f"Кількість платежів (Грейс): {data.get('grace','')}\n"
-            f"Кількість вкладень: {len(files)}\n"
-        )
-        summary = (
-            "✅ <b>Заявку відправлено на пошту.</b>\n\n"
-            "<b>Що відправлено:</b>\n"
-            f"• <b>ПІБ клієнта:</b> {data.get('fullname','')}\n"
-            f"• <b>Адреса ТТ:</b> {data.get('shop_addr','')}\n"
-            f"• <b>ІПН клієнта:</b> {data.get('tax_id','')}\n"
-            f"• <b>Моб. телефон:</b> {data.get('phone','')}\n"
-            f"• <b>Товар:</b> {data.get('product','')}\n"
-            f"• <b>Вартість товару:</b> {data.get('price','')}\n"
-            f"• <b>Перший внесок:</b> {data.get('downpay','')}\n"
-            f"• <b>Кількість платежів (Грейс):</b> {data.get('grace','')}\n"
-            f"• <b>Вкладень:</b> {len(files)}"
-        )
+        session = _spool_key(call.message.chat.id, owner_id)
+        if await state.get_state() != Zayavka.wait_attachments.state:
+            # чернетки вже немає — найчастіше це друге натискання після відправки
+            await call.answer(SUBMIT_REPEAT_TEXT[DONE] if ledger.recently_sent(session) else None)
+            return
+        note = None
         try:
-            await asyncio.to_thread(send_email, subject, _html_plain(body_text), files)
-            await _safe_del(call.message.chat.id, data.get("bot_q"))
-            await state.clear()
-            await call.message.answer(summary, parse_mode="HTML", disable_notification=True)
+            verdict = await _submit_zayavka(
+                call.message.chat.id, call.from_user, state,
+                lambda t: call.message.answer(t, disable_notification=True),
+            )
+            note = SUBMIT_REPEAT_TEXT.get(verdict)
+            if verdict != BUSY:
+                # повідомлення "в черзі" вже надіслано — прибирання у фоні
+                _spawn(_safe_del_many(call.message.chat.id, [(await state.get_data()).get("bot_q")]))
+                await state.clear()
+                attach_spool.release(session)
         except Exception as e:
             await call.message.answer(f"❌ Помилка надсилання: {e}", disable_notification=True)
         finally:
-            await call.answer()
+            await call.answer(note)
         return
 
 # приватний старт із payload або з "мітки очікування"
@@ -262,14 +852,8 @@ async def start_private(message: Message, state: FSMContext):
 
     # 2) якщо payload немає — дивимось "мітку очікування"
     if not ok_to_autostart and message.from_user:
-        uid = message.from_user.id
-        now = time.time()
-        if uid in PENDING_START and PENDING_START[uid] > now:
-            ok_to_autostart = True
-        # почистимо прострочені
-        for k, v in list(PENDING_START.items()):
-            if v <= now:
-                PENDING_START.pop(k, None)
+        # прострочені мітки прибирає сам TTLMap
+        ok_to_autostart = message.from_user.id in PENDING_START
 
     if ok_to_autostart:
         await zayavka_start(message, state)
@@ -282,255 +866,249 @@ async def start_private(message: Message, state: FSMContext):
 async def zayavka_start(message: Message, state: FSMContext):
     # якщо в групі — даємо приватну кнопку і ставимо "мітку очікування" автору
     if message.chat.type in (ChatType.GROUP, ChatType.SUPERGROUP):
-        if not _allowed(message):
-            return
         note = "Щоб дані були приватні, запустіть майстер в особистих повідомленнях."
         owner_id = message.from_user.id if message.from_user else 0
         # мітка очікування 5 хв
         if owner_id:
-            PENDING_START[owner_id] = time.time() + PENDING_TTL_SEC
+            PENDING_START[owner_id] = message.chat.id
         await message.answer(note, reply_markup=_private_link_kb(owner_id), disable_notification=True)
         return
 
     # приватний діалог — працюємо як майстер
-    if not _allowed_for_wizard(message):
-        return
-
     await state.clear()
-    txt = (
-        "📝 <b>Відправити заявку</b>\n\n"
-        "Тема листа буде такою:\n"
-        "<code>(заявка) ПІБ_клієнта mobiletrend.com.ua</code>\n\n"
-        "Введіть, будь ласка, <b>ПІБ клієнта</b> одним повідомленням."
-    )
-    await state.set_state(Zayavka.wait_fullname)
-    await _ask_next(message, state, txt)
-
-@dp.message(Zayavka.wait_fullname)
-async def z_fullname(message: Message, state: FSMContext):
-    fio = (message.text or "").strip()
-    if not fio:
-        await message.reply("Будь ласка, введіть ПІБ клієнта.", disable_notification=True)
+    if message.from_user:
+        session = _spool_key(message.chat.id, message.from_user.id)
+        attach_spool.release(session)
+        # нова чернетка — попередня відправка вже не робить її повтором
+        ledger.forget(session)
+    await state.set_state(WIZARD_STEPS[0].state)
+    if message.from_user:
+        # група, з якої прийшов агент, визначає, куди піде заявка
+        await state.update_data(origin_chat=PENDING_START.get(message.from_user.id, message.chat.id))
+    await _ask_next(message, state, WIZARD_STEPS[0].prompt)
+
+# ---------- WIZARD STEPS ----------
+@dataclass(frozen=True)
+class Step:
+    state: State
+    key: str          # поле в даних FSM
+    prompt: str       # питання, яке бачить користувач у цьому стані
+    required: str = ""  # текст-нагадування, якщо порожня відповідь недопустима
+
+ATTACH_INTRO = (
+    "📎 <b>Додайте файли для заявки</b>\n"
+    "• Фото клієнта на ТТ з паспортом у руках\n"
+    "• Фото ІПН\n"
+    "• Фото паспорта (усі сторінки з даними) або ID-картки (2 боки)\n"
+    "• Фото витяга (якщо ID-картка)\n\n"
+    "Надсилайте фото/документи окремими повідомленнями.\n"
+    "Коли закінчите — натисніть <b>✅ Відправити</b> або введіть <b>/done</b>."
+)
+
+WIZARD_STEPS = [
+    Step(Zayavka.wait_fullname, "fullname",
+         "📝 <b>Відправити заявку</b>\n\n"
+         "Тема листа буде такою:\n"
+         "<code>(заявка) ПІБ_клієнта mobiletrend.com.ua</code>\n\n"
+         "Введіть, будь ласка, <b>ПІБ клієнта</b> одним повідомленням.",
+         required="Будь ласка, введіть ПІБ клієнта."),
+    Step(Zayavka.wait_shop_addr, "shop_addr", "📍 <b>Адресса ТТ</b>\nВведіть адресу торгової точки."),
+    Step(Zayavka.wait_tax_id, "tax_id", "🧾 <b>ІПН клієнта (податковий код)</b>"),
+    Step(Zayavka.wait_phone, "phone", "📱 <b>Мобільний телефон клієнта</b>"),
+    Step(Zayavka.wait_product, "product",
+         "📦 <b>Повна назва товару</b>\n(якщо це телефон — вкажіть обсяг пам’яті та колір)"),
+    Step(Zayavka.wait_price, "price", "💵 <b>Вартість товару</b>"),
+    Step(Zayavka.wait_downpay, "downpay", "💳 <b>Перший внесок</b>"),
+    Step(Zayavka.wait_grace, "grace", "📆 <b>Кількість платежів Грейс</b> (4 чи 6)"),
+]
+_STEP_INDEX = {step.state.state: i for i, step in enumerate(WIZARD_STEPS)}
+
+@dp.message(StateFilter(*(step.state for step in WIZARD_STEPS)))
+async def z_step(message: Message, state: FSMContext):
+    i = _STEP_INDEX[await state.get_state()]
+    step = WIZARD_STEPS[i]
+    value = (message.text or "").strip()
+    if step.required and not value:
+        await message.reply(step.required, disable_notification=True)
         return
+
     data = await state.get_data()
-    await _safe_del(message.chat.id, data.get("bot_q"))
-    await _safe_del(message.chat.id, message.message_id)
-    await state.update_data(fullname=fio)
-    await state.set_state(Zayavka.wait_shop_addr)
-    await _ask_next(message, state, "📍 <b>Адресса ТТ</b>\nВведіть адресу торгової точки.")
-
-@dp.message(Zayavka.wait_shop_addr)
-async def z_shop_addr(message: Message, state: FSMContext):
-    data = await state.get_data()
-    await state.update_data(shop_addr=(message.text or "").strip())
-    await _safe_del(message.chat.id, data.get("bot_q"))
-    await _safe_del(message.chat.id, message.message_id)
-    await state.set_state(Zayavka.wait_tax_id)
-    await _ask_next(message, state, "🧾 <b>ІПН клієнта (податковий код)</b>")
-
-@dp.message(Zayavka.wait_tax_id)
-async def z_tax(message: Message, state: FSMContext):
-    data = await state.get_data()
-    await state.update_data(tax_id=(message.text or "").strip())
-    await _safe_del(message.chat.id, data.get("bot_q"))
-    await _safe_del(message.chat.id, message.message_id)
-    await state.set_state(Zayavka.wait_phone)
-    await _ask_next(message, state, "📱 <b>Мобільний телефон клієнта</b>")
-
-@dp.message(Zayavka.wait_phone)
-async def z_phone(message: Message, state: FSMContext):
-    data = await state.get_data()
-    await state.update_data(phone=(message.text or "").strip())
-    await _safe_del(message.chat.id, data.get("bot_q"))
-    await _safe_del(message.chat.id, message.message_id)
-    await state.set_state(Zayavka.wait_product)
-    await _ask_next(message, state, "📦 <b>Повна назва товару</b>\n(якщо це телефон — вкажіть обсяг пам’яті та колір)")
-
-@dp.message(Zayavka.wait_product)
-async def z_product(message: Message, state: FSMContext):
-    data = await state.get_data()
-    await state.update_data(product=(message.text or "").strip())
-    await _safe_del(message.chat.id, data.get("bot_q"))
-    await _safe_del(message.chat.id, message.message_id)
-    await state.set_state(Zayavka.wait_price)
-    await _ask_next(message, state, "💵 <b>Вартість товару</b>")
-
-@dp.message(Zayavka.wait_price)
-async def z_price(message: Message, state: FSMContext):
-    data = await state.get_data()
-    await state.update_data(price=(message.text or "").strip())
-    await _safe_del(message.chat.id, data.get("bot_q"))
-    await _safe_del(message.chat.id, message.message_id)
-    await state.set_state(Zayavka.wait_downpay)
-    await _ask_next(message, state, "💳 <b>Перший внесок</b>")
-
-@dp.message(Zayavka.wait_downpay)
-async def z_downpay(message: Message, state: FSMContext):
-    data = await state.get_data()
-    await state.update_data(downpay=(message.text or "").strip())
-    await _safe_del(message.chat.id, data.get("bot_q"))
-    await _safe_del(message.chat.id, message.message_id)
-    await state.set_state(Zayavka.wait_grace)
-    await _ask_next(message, state, "📆 <b>Кількість платежів Грейс</b> (4 чи 6)")
-
-@dp.message(Zayavka.wait_grace)
-async def z_to_attachments(message: Message, state: FSMContext):
-    data_prev = await state.get_data()
-    await state.update_data(grace=(message.text or "").strip(), files=[])
-    await _safe_del(message.chat.id, data_prev.get("bot_q"))
-    await _safe_del(message.chat.id, message.message_id)
-    await state.set_state(Zayavka.wait_attachments)
-    intro = (
-        "📎 <b>Додайте файли для заявки</b>\n"
-        "• Фото клієнта на ТТ з паспортом у руках\n"
-        "• Фото ІПН\n"
-        "• Фото паспорта (усі сторінки з даними) або ID-картки (2 боки)\n"
-        "• Фото витяга (якщо ID-картка)\n\n"
-        "Надсилайте фото/документи окремими повідомленнями.\n"
-        "Коли закінчите — натисніть <b>✅ Відправити</b> або введіть <b>/done</b>."
-    )
-    await _ask_next(message, state, intro + "\n\n<b>Додано файлів:</b> 0", with_send=True)
+    if step.key == "tax_id" and value and message.from_user and await access.is_agent(bot, message.from_user.id):
+        # до вкладень: агент ще може зупинитися, якщо клієнта вже подавали;
+        # майстер відкритий будь-кому в приваті, тож архів показуємо лише агентам
+        earlier = await archive.by_tax_id(value)
+        if earlier:
+            await message.answer(
+                "⚠️ <b>Заявку з цим ІПН уже відправляли:</b>\n" + "\n".join(map(_archive_line, earlier))
+                + "\n\nМожна продовжити або скасувати.",
+                parse_mode="HTML", disable_notification=True,
+            )
+    if i + 1 < len(WIZARD_STEPS):
+        nxt = WIZARD_STEPS[i + 1]
+        await state.update_data({step.key: value})
+        await state.set_state(nxt.state)
+        await _ask_next(message, state, nxt.prompt)
+    else:
+        await state.update_data({step.key: value, "files": []})
+        await state.set_state(Zayavka.wait_attachments)
+        await _ask_next(message, state, ATTACH_INTRO + "\n\n<b>Додано файлів:</b> 0", with_send=True)
+    # наступне питання вже надіслано — прибирання не тримає користувача
+    _spawn(_safe_del_many(message.chat.id, [data.get("bot_q"), message.message_id]))
 
 @dp.message(Zayavka.wait_attachments, F.photo | F.document)
 async def z_collect_files(message: Message, state: FSMContext):
-    data = await state.get_data()
-    files: list[tuple[str, bytes]] = data.get("files", [])
-
-    if message.photo:
-        ph = message.photo[-1]
-        name, content = await _fetch(ph.file_id, f"photo_{message.message_id}.jpg")
-        files.append((name, content))
-    elif message.document:
-        d = message.document
-        name = d.file_name or f"document_{message.message_id}"
-        name, content = await _fetch(d.file_id, name)
-        files.append((name, content))
-
-    await state.update_data(files=files)
-    await _safe_del(message.chat.id, message.message_id)
-    await _safe_del(message.chat.id, data.get("bot_q"))
-    await _ask_next(
-        message, state,
-        "📎 <b>Додайте файли для заявки</b>\n"
-        "Надсилайте ще, або натисніть <b>✅ Відправити</b> / введіть <b>/done</b>.\n\n"
-        f"<b>Додано файлів:</b> {len(files)}",
-        with_send=True
+    key = None
+    if message.media_group_id:
+        # альбом приходить пачкою апдейтів — перший забирає всю пачку, решта виходять
+        key = (message.chat.id, message.from_user.id if message.from_user else 0, message.media_group_id)
+        if key in _album_batches:
+            _album_batches[key].append(message)
+            return
+
+    session = _spool_key(message.chat.id, message.from_user.id if message.from_user else 0)
+    task = asyncio.current_task()
+    pending = _collecting.setdefault(session, set())
+    pending.add(task)
+    try:
+        await _collect_batch(message, state, session, key)
+    finally:
+        pending.discard(task)
+        if not pending and _collecting.get(session) is pending:
+            del _collecting[session]
+
+async def _collect_batch(message: Message, state: FSMContext, session: str, key: tuple | None):
+    batch = [message]
+    if key is not None:
+        batch = _album_batches[key] = [message]
+        seen = 0
+        while seen != len(batch):
+            seen = len(batch)
+            await asyncio.sleep(ALBUM_DEBOUNCE_SEC)
+        _album_batches.pop(key, None)
+        batch.sort(key=lambda m: m.message_id)
+
+    results = await asyncio.gather(
+        *(_fetch(session, *f) for m in batch for f in _message_files(m)),
+        return_exceptions=True
     )
+    added = [r for r in results if isinstance(r, dict)]
+    errors = [r for r in results if isinstance(r, BaseException)]
+    for handle in added:
+        _optimize_later(session, handle)
+
+    # read-modify-write files під локом власника, щоб паралельні апдейти не губили файли
+    async with _owner_lock(session):
+        data = await state.get_data()
+        files: list[dict] = data.get("files", []) + added
+        await state.update_data(files=files)
+        if errors:
+            await message.answer(f"⚠️ Не додано файлів: {len(errors)} ({errors[0]}).", disable_notification=True)
+        await _ask_next(
+            message, state,
+            "📎 <b>Додайте файли для заявки</b>\n"
+            "Надсилайте ще, або натисніть <b>✅ Відправити</b> / введіть <b>/done</b>.\n\n"
+            f"<b>Додано файлів:</b> {len(files)}",
+            with_send=True
+        )
+    _spawn(_safe_del_many(message.chat.id, [m.message_id for m in batch] + [data.get("bot_q")]))
 
 @dp.message(Zayavka.wait_attachments, Command("done"))
 async def z_finish_attachments(message: Message, state: FSMContext):
     data = await state.get_data()
-    await _safe_del(message.chat.id, data.get("bot_q"))
-    await _safe_del(message.chat.id, message.message_id)
-
-    subject = f"(заявка) {data.get('fullname','').strip()} mobiletrend.com.ua"
-    body_text = (
-        f"Заявка від @{message.from_user.username or message.from_user.full_name} (id: {message.from_user.id})\n"
-        f"ПІБ клієнта: {data.get('fullname','')}\n"
-        f"Адреса ТТ: {data.get('shop_addr','')}\n"
-        f"ІПН клієнта: {data.get('tax_id','')}\n"
-        f"Моб. телефон: {data.get('phone','')}\n"
-        f"Товар (повна назва): {data.get('product','')}\n"
-        f"Вартість товару: {data.get('price','')}\n"
-        f"Перший внесок: {data.get('downpay','')}\n"
-        f"Кількість платежів (Грейс): {data.get('grace','')}\n"
-        f"Кількість вкладень: {len(data.get('files', []))}\n"
-    )
-    summary = (
-        "✅ <b>Заявку відправлено на пошту.</b>\n\n"
-        "<b>Що відправлено:</b>\n"
-        f"• <b>ПІБ клієнта:</b> {data.get('fullname','')}\n"
-        f"• <b>Адреса ТТ:</b> {data.get('shop_addr','')}\n"
-        f"• <b>ІПН клієнта:</b> {data.get('tax_id','')}\n"
-        f"• <b>Моб. телефон:</b> {data.get('phone','')}\n"
-        f"• <b>Товар:</b> {data.get('product','')}\n"
-        f"• <b>Вартість товару:</b> {data.get('price','')}\n"
-        f"• <b>Перший внесок:</b> {data.get('downpay','')}\n"
-        f"• <b>Кількість платежів (Грейс):</b> {data.get('grace','')}\n"
-        f"• <b>Вкладень:</b> {len(data.get('files', []))}"
-    )
-
+    stale = [data.get("bot_q"), message.message_id]
+    verdict = None
     try:
-        await asyncio.to_thread(send_email, subject, _html_plain(body_text), data.get('files', []))
-        await message.answer(summary, parse_mode="HTML", disable_notification=True)
+        verdict = await _submit_zayavka(
+            message.chat.id, message.from_user, state,
+            lambda t: message.answer(t, disable_notification=True),
+        )
+        if verdict is not None:
+            await message.answer(SUBMIT_REPEAT_TEXT[verdict], disable_notification=True)
     except Exception as e:
         await message.answer(f"❌ Помилка надсилання: {e}", disable_notification=True)
     finally:
-        await state.clear()
+        # BUSY — заявку вже відправляє інший тригер, він і прибере чернетку
+        if verdict != BUSY:
+            # альбом, який дочікувався перед відправкою, міг поставити нове питання з кнопкою
+            bot_q = (await state.get_data()).get("bot_q")
+            if bot_q != data.get("bot_q"):
+                stale.append(bot_q)
+            await state.clear()
+            attach_spool.release(_spool_key(message.chat.id, message.from_user.id))
+        # відповідь уже надіслано — прибирання не тримає користувача
+        _spawn(_safe_del_many(message.chat.id, stale))
 
 @dp.message(Zayavka.wait_attachments)
 async def z_ignore_other(message: Message, state: FSMContext):
     if message.text and message.text.startswith('/'):
         return
     data = await state.get_data()
-    await _safe_del(message.chat.id, message.message_id)
-    await _safe_del(message.chat.id, data.get("bot_q"))
     await _ask_next(
         message, state,
         "📎 Надішліть фото/документ як повідомлення, або завершіть <b>/done</b> / натисніть <b>✅ Відправити</b>.",
         with_send=True
     )
+    _spawn(_safe_del_many(message.chat.id, [message.message_id, data.get("bot_q")]))
 
 # ---- інші команди як були ----
 
-@dp.message(Command("toemail"))
+GROUP_CHATS = F.chat.type.in_({ChatType.GROUP, ChatType.SUPERGROUP})
+
+@dp.message(Command("toemail"), GROUP_CHATS)
 async def forward_reply(message: Message):
-    if not _allowed(message):
-        return
     if not message.reply_to_message:
         await message.reply("Зробіть реплай на повідомлення. Приклад: /toemail Тема", disable_notification=True)
         return
 
     theme = message.text.split(" ", 1)[1] if " " in message.text else "Без теми"
     origin = message.reply_to_message
-    body_text = origin.text or origin.caption or "[Без тексту — вкладення]"
-
-    attachments = []
-    if origin.photo:
-        ph = origin.photo[-1]
-        attachments.append(await _fetch(ph.file_id, f"photo_{origin.message_id}.jpg"))
-    if origin.document:
-        d = origin.document
-        name = d.file_name or f"document_{origin.message_id}"
-        attachments.append(await _fetch(d.file_id, name))
-    if origin.voice:
-        v = origin.voice
-        attachments.append(await _fetch(v.file_id, f"voice_{origin.message_id}.ogg"))
-    if origin.audio:
-        a = origin.audio
-        attachments.append(await _fetch(a.file_id, a.file_name or f"audio_{origin.message_id}.mp3"))
-    if origin.video:
-        v = origin.video
-        attachments.append(await _fetch(v.file_id, f"video_{origin.message_id}.mp4"))
-    if origin.video_note:
-        vn = origin.video_note
-        attachments.append(await _fetch(vn.file_id, f"videonote_{origin.message_id}.mp4"))
+    album = _album_of(origin)
+    caption = next((m.caption for m in album if m.caption), None)
+    body_text = origin.text or origin.caption or caption or "[Без тексту — вкладення]"
 
+    session = f"r{message.chat.id}_{message.message_id}"
     try:
-        await asyncio.to_thread(
-            send_email,
+        attachments = await _fetch_all(session, album)
+
+        if DIGEST_TOEMAIL and digest.enabled(message.chat.id):
+            # файли тепер належать дайджесту — спул звільнить _flush_digest
+            item = _digest_item("REPLY", theme, body_text, origin, attachments, session)
+            await digest.add(message.chat.id, item)
+            session = None
+            await message.reply("🗂 Додано до дайджесту — піде одним листом.", disable_notification=True)
+            return
+
+        await _queue_mail(
+            lambda t: message.reply(t, disable_notification=True),
             _subject("REPLY", theme, origin),
             _html_with_meta(body_text, origin, "Відправлено з реплаю."),
-            attachments
+            attachments,
+            "✅ Відправлено на пошту.",
+            routes=routing.resolve(message.chat.id, "toemail"),
         )
-        await message.reply("✅ Відправлено на пошту.", disable_notification=True)
     except Exception as e:
         await message.reply(f"❌ Помилка надсилання: {e}", disable_notification=True)
+    finally:
+        if session:
+            attach_spool.release(session)
 
-@dp.message(F.text.startswith("!mail"))
+@dp.message(F.text.startswith("!mail"), GROUP_CHATS)
 async def trigger_mail(message: Message):
-    if not _allowed(message):
-        return
     raw = message.text[len("!mail"):].strip()
     theme, text = ("Без теми", raw or "[порожньо]") if "|" not in raw else [x.strip() for x in raw.split("|", 1)]
+    if digest.enabled(message.chat.id):
+        await digest.add(message.chat.id, _digest_item("MSG", theme, text, message))
+        await message.reply("🗂 Додано до дайджесту — піде одним листом.", disable_notification=True)
+        return
     try:
-        await asyncio.to_thread(
-            send_email,
+        await _queue_mail(
+            lambda t: message.reply(t, disable_notification=True),
             _subject("MSG", theme, message),
             _html_with_meta(text, message, "Відправлено тригером !mail."),
-            []
+            [],
+            "✅ Відправлено на пошту.",
+            routes=routing.resolve(message.chat.id, "mail"),
         )
-        await message.reply("✅ Відправлено на пошту.", disable_notification=True)
     except Exception as e:
         await message.reply(f"❌ Помилка надсилання: {e}", disable_notification=True)
 
@@ -541,14 +1119,90 @@ async def setup_commands():
         BotCommand(command="cancel",  description="Скасувати заповнення заявки"),
     ]
     await bot.set_my_commands(cmds, scope=BotCommandScopeAllGroupChats())
+    # /find відповідає лише в приваті (і лише агентам)
+    await bot.set_my_commands(
+        cmds + [BotCommand(command="find", description="Знайти відправлену заявку")],
+        scope=BotCommandScopeAllPrivateChats(),
+    )
 
 # ---------- RUN ----------
+_update_sem = asyncio.Semaphore(WEBHOOK_MAX_CONCURRENCY)
+
+async def _limit_updates(handler, update, data: dict):
+    async with _update_sem:
+        return await handler(update, data)
+
+async def run_webhook():
+    # Telegram отримує 200 одразу, апдейт обробляється у фоновій задачі
+    dp.update.outer_middleware(_limit_updates)
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET, handle_in_background=True
+    ).register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/healthz", lambda request: web.Response(text="ok"))
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+    # у polling сигнали ловить сам aiogram; тут SIGTERM/SIGINT лише будять очікування,
+    # щоб main() пройшов той самий finally (дайджести, черга, пули, сховища)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    signals = (signal.SIGTERM, signal.SIGINT)
+    for sig in signals:
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        for sig in signals:
+            loop.remove_signal_handler(sig)
+        await runner.cleanup()
+
 async def main():
     global BOT_USERNAME
     me = await bot.get_me()
     BOT_USERNAME = me.username
     await setup_commands()
-    await dp.start_polling(bot)
+    await mail_queue.start()
+    attach_spool.start()
+    access.start(ACCESS_RELOAD_SEC)
+    PENDING_START.start(TTL_REAP_SEC)
+    ALBUMS.start(TTL_REAP_SEC)
+    if hasattr(signal, "SIGHUP"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, access.reload)
+    fsm_storage.start()
+    metrics_runner = await metrics.serve(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    try:
+        if WEBHOOK_MODE:
+            await run_webhook()
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        # незібрані дайджести — у чергу до її зупинки; stop() ще дошле все, що дозріло
+        try:
+            await digest.flush_all()
+        except Exception as e:
+            ERRORS.inc("digest_flush", type(e).__name__)
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await access.stop()
+        await PENDING_START.stop()
+        await ALBUMS.stop()
+        await attach_spool.stop()
+        await mail_queue.stop()
+        await fsm_storage.close()
+        ledger.close()
+        archive.close()
+        await asyncio.gather(*(pool.close() for pool in _smtp_pools.values()))
+        cpu_pool.shutdown()
+        await bot.session.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
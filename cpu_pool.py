@@ -0,0 +1,27 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# спільний пул процесів для CPU-важкої роботи (стиснення, обробка фото),
+# щоб вона не блокувала event loop
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "0")) or None  # 0 -> за кількістю ядер
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def get() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=CPU_WORKERS)
+    return _executor
+
+
+async def run(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(get(), fn, *args)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,94 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+
+@dataclass(frozen=True)
+class DigestRule:
+    window: float     # сек від першого елемента до відправки
+    max_items: int
+    max_bytes: int
+
+
+@dataclass
+class DigestItem:
+    kind: str                 # "MSG" (!mail) або "REPLY" (/toemail)
+    theme: str
+    text: str
+    chat_title: str
+    sender: str
+    permalink: str
+    attachments: list = field(default_factory=list)
+    session: str | None = None   # сесія спулу, яку треба звільнити після відправки
+    at: float = field(default_factory=time.time)
+
+    @property
+    def size(self) -> int:
+        return len(self.text.encode()) + sum(a.get("size", 0) for a in self.attachments)
+
+
+def parse_rules(raw: str, default: DigestRule) -> dict[int, DigestRule]:
+    """``-100123,-100456=60/20/512`` -> {chat_id: DigestRule}; після ``=`` — сек/штук/КБ."""
+    rules = {}
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        chat, _, spec = part.partition("=")
+        if not chat.strip().lstrip("-").isdigit():
+            continue
+        rule = default
+        if spec:
+            window, items, kb = (spec.split("/") + ["", "", ""])[:3]
+            rule = DigestRule(
+                float(window) if window else default.window,
+                int(items) if items else default.max_items,
+                int(kb) * 1024 if kb else default.max_bytes,
+            )
+        rules[int(chat)] = rule
+    return rules
+
+
+class DigestBuffer:
+    """Накопичує повідомлення по чатах і віддає їх пачкою в ``flush``.
+
+    Пачка йде, щойно спрацює перший із лімітів правила чату: час від першого
+    елемента, кількість елементів або сумарний обсяг.
+    """
+
+    def __init__(self, rules: dict[int, DigestRule],
+                 flush: Callable[[int, list[DigestItem]], Awaitable[None]]):
+        self.rules = rules
+        self.flush = flush
+        self._items: dict[int, list[DigestItem]] = {}
+        self._timers: dict[int, asyncio.Task] = {}
+
+    def enabled(self, chat_id: int) -> bool:
+        return chat_id in self.rules
+
+    async def add(self, chat_id: int, item: DigestItem):
+        rule = self.rules[chat_id]
+        items = self._items.setdefault(chat_id, [])
+        items.append(item)
+        if len(items) >= rule.max_items or sum(i.size for i in items) >= rule.max_bytes:
+            await self._flush(chat_id)
+        elif chat_id not in self._timers:
+            self._timers[chat_id] = asyncio.create_task(self._timer(chat_id, rule.window))
+
+    async def _timer(self, chat_id: int, window: float):
+        await asyncio.sleep(window)
+        self._timers.pop(chat_id, None)
+        await self._flush(chat_id)
+
+    async def _flush(self, chat_id: int):
+        timer = self._timers.pop(chat_id, None)
+        if timer and timer is not asyncio.current_task():
+            timer.cancel()
+        items = self._items.pop(chat_id, None)
+        if items:
+            await self.flush(chat_id, items)
+
+    async def flush_all(self):
+        for chat_id in list(self._items):
+            await self._flush(chat_id)
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import shutil
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+
+from aiogram import Bot
+
+
+@dataclass
+class _Entry:
+    path: str
+    size: int
+    created: float
+
+
+class FileCache:
+    """Кеш завантажень з Telegram за ``file_unique_id``.
+
+    Дисковий рівень — файли в ``root`` з LRU-витісненням за сумарним обсягом
+    і TTL; малий рівень у пам'яті тримає байти невеликих файлів. Паралельні
+    запити одного файлу чекають на одне завантаження. Файл, який саме
+    копіюється в спул, не витісняється, навіть якщо сам більший за бюджет;
+    ``max_bytes == 0`` вимикає кеш — файли качаються одразу в спул.
+    """
+
+    def __init__(self, root: str, max_bytes: int, ttl: float,
+                 mem_max_bytes: int = 8 * 2**20, mem_item_max: int = 256 * 2**10):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.mem_max_bytes = mem_max_bytes
+        self.mem_item_max = mem_item_max
+        os.makedirs(root, exist_ok=True)
+        self._disk: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._disk_bytes = 0
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._mem_bytes = 0
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._pins: Counter[str] = Counter()  # uid -> скільки copy_to зараз його чекають/копіюють
+        self.hits_mem = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith(".part"):
+                os.remove(path)
+                continue
+            st = os.stat(path)
+            found.append((st.st_mtime, name, _Entry(path, st.st_size, st.st_mtime)))
+        for _, name, entry in sorted(found):
+            self._disk[name] = entry
+            self._disk_bytes += entry.size
+        self._evict()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits_mem": self.hits_mem,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "disk_bytes": self._disk_bytes,
+            "disk_items": len(self._disk),
+            "mem_bytes": self._mem_bytes,
+            "mem_items": len(self._mem),
+        }
+
+    # ---------- рівні ----------
+    def _drop(self, uid: str):
+        entry = self._disk.pop(uid, None)
+        if entry:
+            self._disk_bytes -= entry.size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+        data = self._mem.pop(uid, None)
+        if data is not None:
+            self._mem_bytes -= len(data)
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        for uid in [uid for uid, e in self._disk.items() if e.created < cutoff and not self._pins[uid]]:
+            self._drop(uid)
+            self.evictions += 1
+        for uid in list(self._disk):
+            if self._disk_bytes <= self.max_bytes:
+                break
+            if not self._pins[uid]:
+                self._drop(uid)
+                self.evictions += 1
+        while self._mem_bytes > self.mem_max_bytes and self._mem:
+            _, data = self._mem.popitem(last=False)
+            self._mem_bytes -= len(data)
+
+    def _lookup(self, uid: str) -> _Entry | None:
+        entry = self._disk.get(uid)
+        if entry is None:
+            return None
+        if not os.path.exists(entry.path):
+            self._drop(uid)
+            return None
+        if entry.created < time.time() - self.ttl:
+            # прострочений перекачаємо; файл лишаємо, поки його ще хтось копіює
+            if self._pins[uid] <= 1:
+                self._drop(uid)
+            return None
+        self._disk.move_to_end(uid)
+        if uid in self._mem:
+            self._mem.move_to_end(uid)
+        return entry
+
+    def _remember_small(self, uid: str, path: str, size: int):
+        if size > self.mem_item_max:
+            return
+        with open(path, "rb") as fh:
+            data = fh.read()
+        self._mem[uid] = data
+        self._mem_bytes += len(data)
+
+    async def _download(self, bot: Bot, file_id: str, uid: str) -> _Entry:
+        path = os.path.join(self.root, uid)
+        await bot.download(file_id, destination=path + ".part")
+        os.replace(path + ".part", path)
+        entry = _Entry(path, os.path.getsize(path), time.time())
+        old = self._disk.pop(uid, None)
+        if old:
+            self._disk_bytes -= old.size
+        self._disk[uid] = entry
+        self._disk_bytes += entry.size
+        self._remember_small(uid, path, entry.size)
+        # витіснення — після копіювання в copy_to, інакше файл більший за бюджет зник би одразу
+        return entry
+
+    async def _get(self, bot: Bot, file_id: str, uid: str) -> _Entry:
+        entry = self._lookup(uid)
+        if entry is not None:
+            self.hits_disk += 1
+            return entry
+        fut = self._inflight.get(uid)
+        if fut is not None:
+            self.coalesced += 1
+            return await asyncio.shield(fut)
+        self.misses += 1
+        fut = self._inflight[uid] = asyncio.ensure_future(self._download(bot, file_id, uid))
+        try:
+            return await asyncio.shield(fut)
+        finally:
+            if fut.done():
+                self._inflight.pop(uid, None)
+            else:
+                fut.add_done_callback(lambda _: self._inflight.pop(uid, None))
+
+    # ---------- API ----------
+    async def copy_to(self, bot: Bot, file_id: str, uid: str, dest: str) -> int:
+        """Кладе файл у ``dest`` (hardlink, якщо можна) і повертає його розмір."""
+        if not self.max_bytes:
+            self.misses += 1
+            await bot.download(file_id, destination=dest)
+            return os.path.getsize(dest)
+        data = self._mem.get(uid)
+        if data is not None and self._lookup(uid) is not None:
+            self.hits_mem += 1
+            with open(dest, "wb") as fh:
+                fh.write(data)
+            return len(data)
+        self._pins[uid] += 1
+        try:
+            entry = await self._get(bot, file_id, uid)
+            try:
+                os.link(entry.path, dest)
+            except OSError:
+                await asyncio.to_thread(shutil.copyfile, entry.path, dest)
+        finally:
+            self._pins[uid] -= 1
+            if not self._pins[uid]:
+                del self._pins[uid]
+            self._evict()
+        return entry.size
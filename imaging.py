@@ -0,0 +1,40 @@
+import os
+
+import cpu_pool
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow не обов'язковий — без нього фото йдуть як є
+    Image = None
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def _optimize(path: str, max_side: int, quality: int) -> int | None:
+    # виконується в окремому процесі
+    tmp = path + ".opt"
+    with Image.open(path) as im:
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail((max_side, max_side), Image.LANCZOS)
+        if im.mode != "RGB":
+            im = im.convert("RGB")
+        im.save(tmp, "JPEG", quality=quality, optimize=True, progressive=True)
+    new_size = os.path.getsize(tmp)
+    if new_size >= os.path.getsize(path):
+        os.remove(tmp)
+        return None
+    # новий файл замість старого: hardlink у кеші завантажень лишається недоторканим
+    os.replace(tmp, path)
+    return new_size
+
+
+async def optimize_jpeg(path: str, max_side: int, quality: int) -> int | None:
+    """Зменшує фото до ``max_side`` по довшій стороні і перестискає JPEG у пулі процесів.
+
+    Повертає новий розмір або None, якщо файл лишився як був.
+    """
+    if Image is None:
+        return None
+    return await cpu_pool.run(_optimize, path, max_side, quality)
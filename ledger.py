@@ -0,0 +1,114 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from ttl_map import TTLMap
+
+# що повертає begin(), якщо відправляти не можна
+BUSY = "busy"  # у власника вже йде відправка
+DONE = "done"  # саме цю заявку вже поставлено в чергу
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    key     TEXT PRIMARY KEY,
+    owner   TEXT NOT NULL,
+    job_id  INTEGER,
+    done_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS submissions_done ON submissions (done_at);
+"""
+
+
+def submission_key(owner: str, fields: dict, files: list[dict]) -> str:
+    """Ключ ідемпотентності: власник, поля чернетки і file_unique_id вкладень."""
+    raw = json.dumps(
+        {
+            "owner": owner,
+            "fields": fields,
+            # без uid (старі handle) — хоч би ім'я й розмір
+            "files": [f.get("uid") or f"{f.get('name')}:{f.get('size')}" for f in files],
+        },
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class SubmissionLedger:
+    """Журнал відправлених заявок, щоб подвійний тригер не давав двох листів.
+
+    ``begin`` ставить на власника мітку «відправляється»: поки її не зняли
+    ``complete``/``abort``, інші спроби того ж власника отримують ``BUSY``.
+    Завершені ключі пишуться в SQLite і переживають перезапуск; повтор того
+    самого ключа дає ``DONE``. Останні ``window`` секунд ключі й власники
+    тримаються ще й у пам'яті, щоб швидко відповісти на повторне натискання.
+    """
+
+    def __init__(self, db_path: str, window: float = 600.0, keep_sec: float = 30 * 24 * 3600):
+        self.keep_sec = keep_sec
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._inflight: dict[str, str] = {}  # owner -> key
+        self._recent: TTLMap[str, int | None] = TTLMap(window, max_size=10000)  # key -> job_id
+        self._recent_owners: TTLMap[str, int | None] = TTLMap(window, max_size=10000)  # owner -> job_id
+
+    def _lookup(self, key: str) -> tuple[int | None] | None:
+        with self._lock:
+            return self._db.execute("SELECT job_id FROM submissions WHERE key = ?", (key,)).fetchone()
+
+    async def begin(self, owner: str, key: str) -> str | None:
+        """None — можна відправляти (і обов'язково потім complete/abort), інакше BUSY/DONE."""
+        if owner in self._inflight:
+            return BUSY
+        if key in self._recent:
+            return DONE
+        # мітку ставимо до першого await, тож паралельний хендлер її вже побачить
+        self._inflight[owner] = key
+        try:
+            row = await asyncio.to_thread(self._lookup, key)
+        except BaseException:
+            self._inflight.pop(owner, None)
+            raise
+        if row is not None:
+            self._inflight.pop(owner, None)
+            self._recent[key] = row[0]
+            return DONE
+        return None
+
+    def _record(self, owner: str, key: str, job_id: int | None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO submissions (key, owner, job_id, done_at) VALUES (?, ?, ?, ?)",
+                (key, owner, job_id, now),
+            )
+            self._db.execute("DELETE FROM submissions WHERE done_at < ?", (now - self.keep_sec,))
+
+    async def complete(self, owner: str, key: str, job_id: int | None = None):
+        try:
+            await asyncio.to_thread(self._record, owner, key, job_id)
+        finally:
+            self._recent[key] = job_id
+            self._recent_owners[owner] = job_id
+            self._inflight.pop(owner, None)
+
+    def abort(self, owner: str):
+        self._inflight.pop(owner, None)
+
+    def sending(self, owner: str) -> bool:
+        return owner in self._inflight
+
+    def recently_sent(self, owner: str) -> bool:
+        return owner in self._recent_owners
+
+    def forget(self, owner: str):
+        """Власник почав нову чернетку: ``recently_sent`` знову False."""
+        self._recent_owners.pop(owner, None)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
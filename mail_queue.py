@@ -0,0 +1,245 @@
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable
+
+HELD = "held"        # рядок створено, вкладення ще пишуться на диск
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+DEAD = "dead"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    created    REAL NOT NULL,
+    status     TEXT NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    next_at    REAL NOT NULL,
+    last_error TEXT,
+    payload    TEXT NOT NULL,
+    notify     TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_at);
+"""
+
+# (job_id, notify, error) -> None; error is None при успіху
+ResultCallback = Callable[[int, dict, str | None], Awaitable[None]]
+
+
+class MailQueue:
+    """Дискова черга вихідних листів (SQLite + каталог із вкладеннями).
+
+    ``put`` лише записує лист на диск і одразу повертає id; фонові воркери
+    відправляють листи з експоненційним backoff, а після ``max_attempts``
+    невдалих спроб переводять їх у стан ``dead``. Незавершені листи
+    переживають перезапуск процесу.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        spool_dir: str,
+        send: Callable[[str, str, list[dict], dict, list[str] | None], Awaitable[None]],
+        on_result: ResultCallback | None = None,
+        workers: int = 2,
+        max_attempts: int = 8,
+        base_delay: float = 5.0,
+        max_delay: float = 900.0,
+        keep_sent_sec: float = 24 * 3600,
+    ):
+        self.spool_dir = spool_dir
+        self.send = send
+        self.on_result = on_result
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.keep_sent_sec = keep_sent_sec
+        os.makedirs(spool_dir, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._closing = False
+
+    # ---------- запис ----------
+    def _put(self, subject: str, html_body: str, attachments: list[tuple[str, bytes] | dict],
+             routes: list[str] | None) -> int:
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO outbox (created, status, next_at, payload) VALUES (?, ?, 0, '{}')",
+                (time.time(), HELD),
+            )
+            job_id = cur.lastrowid
+        job_dir = os.path.join(self.spool_dir, str(job_id))
+        os.makedirs(job_dir, exist_ok=True)
+        files = []
+        for idx, att in enumerate(attachments or []):
+            path = os.path.join(job_dir, f"{idx:03d}")
+            if isinstance(att, dict):
+                # handle зі спулу вкладень — файл уже на диску, просто забираємо його
+                shutil.move(att["path"], path)
+                name = att["name"]
+            else:
+                name, data = att
+                with open(path, "wb") as fh:
+                    fh.write(data)
+            files.append({"name": name, "path": path})
+        payload = {"subject": subject, "html": html_body, "files": files}
+        if routes:
+            payload["routes"] = routes
+        payload = json.dumps(payload, ensure_ascii=False)
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, next_at = ?, payload = ? WHERE id = ?",
+                (PENDING, time.time(), payload, job_id),
+            )
+        return job_id
+
+    async def put(self, subject: str, html_body: str, attachments: list[tuple[str, bytes] | dict] = None,
+                  routes: list[str] | None = None) -> int:
+        """``routes`` — імена адресатів, визначені на момент постановки в чергу."""
+        job_id = await asyncio.to_thread(self._put, subject, html_body, attachments or [], routes)
+        self._wakeup.set()
+        return job_id
+
+    def _attach_notify(self, job_id: int, notify: dict) -> str:
+        with self._lock:
+            self._db.execute("UPDATE outbox SET notify = ? WHERE id = ?", (json.dumps(notify), job_id))
+            row = self._db.execute("SELECT status FROM outbox WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else SENT
+
+    async def attach_notify(self, job_id: int, notify: dict) -> str:
+        """Прив'язує дані для повідомлення користувача; повертає поточний статус листа.
+
+        Якщо лист уже встиг завершитись (``sent``/``dead``), воркер цього
+        notify не побачить — повідомити має сам викликач.
+        """
+        return await asyncio.to_thread(self._attach_notify, job_id, notify)
+
+    # ---------- воркери ----------
+    def _recover(self):
+        # листи, що "відправлялись" у момент падіння, повертаємо в чергу
+        with self._lock:
+            self._db.execute("UPDATE outbox SET status = ? WHERE status = ?", (PENDING, SENDING))
+            for (job_id,) in self._db.execute("SELECT id FROM outbox WHERE status = ?", (HELD,)).fetchall():
+                self._drop(job_id)
+            self._purge()
+
+    def _purge(self):
+        cutoff = time.time() - self.keep_sent_sec
+        self._db.execute("DELETE FROM outbox WHERE status = ? AND created < ?", (SENT, cutoff))
+
+    def _drop(self, job_id: int):
+        self._db.execute("DELETE FROM outbox WHERE id = ?", (job_id,))
+        shutil.rmtree(os.path.join(self.spool_dir, str(job_id)), ignore_errors=True)
+
+    def _claim(self) -> tuple[int, dict, int] | float | None:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, payload, attempts FROM outbox WHERE status = ? AND next_at <= ? "
+                "ORDER BY next_at, id LIMIT 1",
+                (PENDING, now),
+            ).fetchone()
+            if row:
+                self._db.execute("UPDATE outbox SET status = ? WHERE id = ?", (SENDING, row[0]))
+                return row[0], json.loads(row[1]), row[2]
+            nxt = self._db.execute(
+                "SELECT MIN(next_at) FROM outbox WHERE status = ?", (PENDING,)
+            ).fetchone()[0]
+        return nxt
+
+    def _finish(self, job_id: int, attempts: int, error: str | None,
+                payload: dict) -> tuple[str, dict | None]:
+        with self._lock:
+            if error is None:
+                status = SENT
+                self._db.execute(
+                    "UPDATE outbox SET status = ?, attempts = ?, last_error = NULL, payload = '{}' WHERE id = ?",
+                    (status, attempts, job_id),
+                )
+                shutil.rmtree(os.path.join(self.spool_dir, str(job_id)), ignore_errors=True)
+                self._purge()
+            elif attempts >= self.max_attempts:
+                status = DEAD
+                self._db.execute(
+                    "UPDATE outbox SET status = ?, attempts = ?, last_error = ?, payload = ? WHERE id = ?",
+                    (status, attempts, error, json.dumps(payload, ensure_ascii=False), job_id),
+                )
+            else:
+                status = PENDING
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                delay *= random.uniform(0.8, 1.2)
+                self._db.execute(
+                    "UPDATE outbox SET status = ?, attempts = ?, last_error = ?, next_at = ?, payload = ? "
+                    "WHERE id = ?",
+                    (status, attempts, error, time.time() + delay,
+                     json.dumps(payload, ensure_ascii=False), job_id),
+                )
+            row = self._db.execute("SELECT notify FROM outbox WHERE id = ?", (job_id,)).fetchone()
+        notify = json.loads(row[0]) if row and row[0] else None
+        return status, notify
+
+    async def _deliver(self, payload: dict):
+        # вкладення передаються як {"name", "path"} — send читає їх з диска потоком;
+        # у progress send записує, що вже відправлено, і це зберігається між спробами
+        progress = payload.setdefault("progress", {})
+        await self.send(payload["subject"], payload["html"], payload.get("files", []), progress,
+                        payload.get("routes"))
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            claimed = await asyncio.to_thread(self._claim)
+            if not isinstance(claimed, tuple):
+                if self._closing:
+                    # при зупинці досилаємо те, що вже дозріло (напр. дайджести з flush_all),
+                    # а відкладені повтори лишаємо до наступного запуску
+                    return
+                timeout = 60.0 if claimed is None else max(0.05, claimed - time.time())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, payload, attempts = claimed
+            error = None
+            try:
+                await self._deliver(payload)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            status, notify = await asyncio.to_thread(self._finish, job_id, attempts + 1, error, payload)
+            if status == PENDING:
+                self._wakeup.set()  # інші воркери перерахують час наступного листа
+            elif notify and self.on_result:
+                try:
+                    await self.on_result(job_id, notify, error)
+                except Exception:
+                    pass
+
+    async def start(self):
+        await asyncio.to_thread(self._recover)
+        self._closing = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 30.0):
+        self._closing = True
+        self._wakeup.set()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for t in pending:
+                t.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+        with self._lock:
+            self._db.close()
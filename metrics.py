@@ -0,0 +1,166 @@
+import bisect
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+from aiohttp import web
+
+# секунди: від мілісекунд (кеш, NOOP) до хвилин (великі вкладення по SMTP)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# байти: від мініатюр до 20 МБ — межі Bot API на завантаження
+SIZE_BUCKETS = tuple(2 ** p for p in range(10, 26, 2))
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _head(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1.0):
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> list[str]:
+        return self._head() + [
+            f"{self.name}{_labels(self.labels, lv)} {_num(v)}" for lv, v in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """Значення рахується під час scrape через ``fn`` — на гарячому шляху нічого не коштує.
+
+    ``fn`` повертає число (без міток) або dict {значення мітки(ок): число}.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float | dict], labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def render(self) -> list[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if not isinstance(value, dict):
+            return self._head() + [f"{self.name} {_num(value)}"]
+        lines = self._head()
+        for lv, v in value.items():
+            lv = lv if isinstance(lv, tuple) else (lv,)
+            lines.append(f"{self.name}{_labels(self.labels, lv)} {_num(v)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [лічильники по кошиках (+Inf останній), сума]
+        self._series: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def render(self) -> list[str]:
+        lines = self._head()
+        for lv, (counts, total) in self._series.items():
+            acc = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                acc += n
+                le = 'le="' + _num(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, lv, le)} {acc}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, lv)} {_num(total[0])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, lv)} {acc}")
+        return lines
+
+
+class Registry:
+    """Набір метрик процесу; ``render()`` віддає текстовий формат Prometheus 0.0.4."""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _add(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"метрика {metric.name} вже зареєстрована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (),
+                  buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float | dict], labels: Iterable[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, fn, labels))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+async def serve(host: str, port: int, registry: Registry = REGISTRY) -> web.AppRunner:
+    """Окремий маленький HTTP-сервер з ``GET /metrics``; повертає runner для ``cleanup()``."""
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,103 @@
+import asyncio
+import binascii
+import os
+import uuid
+from email.message import EmailMessage
+from email.policy import SMTP as SMTP_POLICY
+from typing import AsyncIterator
+
+# 57 байт -> рядок base64 на 76 символів, як у email.contentmanager
+LINE_BYTES = 57
+READ_BYTES = LINE_BYTES * 4096  # ~228 КБ за одне читання
+
+
+def encoded_size(n: int) -> int:
+    # base64-рядки по 76 символів + CRLF
+    full, rest = divmod(n, LINE_BYTES)
+    return full * 78 + (((rest + 2) // 3) * 4 + 2 if rest else 0)
+
+
+class StreamingMessage:
+    """Лист, вкладення якого кодуються в base64 частинами прямо під час відправки.
+
+    Заголовки й HTML/plain-альтернативи генерує стандартний ``email``
+    (тому вони такі самі, як у звичайного ``EmailMessage``), а на місці тіла
+    кожного вкладення стоїть маркер, замість якого ``chunks()`` віддає
+    закодований вміст джерела — bytes, шлях до файлу або handle спулу.
+    Пам'ять на лист не залежить від розміру вкладень.
+
+    Каркас листа рендериться один раз, тож той самий лист можна паралельно
+    віддати кільком адресатам; ``prefix`` — додаткові рядки заголовків
+    (напр. свій ``To:``) для конкретної відправки.
+    """
+
+    def __init__(self, msg: EmailMessage):
+        self.msg = msg
+        self._sources: list[tuple[bytes, bytes | str, int]] = []  # (маркер, джерело, розмір)
+        self._pieces: list[bytes] | None = None
+
+    def add_attachment(self, source: bytes | str | dict, maintype: str, subtype: str, filename: str):
+        if isinstance(source, dict):
+            source = source["path"]
+        if isinstance(source, str):
+            size = os.path.getsize(source)
+        else:
+            size = len(source)
+        marker = f"@@attachment-{uuid.uuid4().hex}@@"
+        # порожнє тіло дає ті самі заголовки, що й справжнє вкладення
+        self.msg.add_attachment(b"", maintype=maintype, subtype=subtype, filename=filename)
+        part = self.msg.get_payload()[-1]
+        part.set_payload(marker)
+        self._sources.append((marker.encode(), source, size))
+        self._pieces = None
+
+    def _skeleton(self) -> list[bytes]:
+        if self._pieces is not None:
+            return self._pieces
+        raw = self.msg.as_bytes(policy=SMTP_POLICY)
+        pieces = []
+        for marker, _, _ in self._sources:
+            head, raw = raw.split(marker, 1)
+            pieces.append(head)
+        pieces.append(raw)
+        self._pieces = pieces
+        return pieces
+
+    @property
+    def size(self) -> int:
+        pieces = self._skeleton()
+        return sum(map(len, pieces)) + sum(encoded_size(size) for _, _, size in self._sources)
+
+    async def chunks(self, prefix: bytes = b"") -> AsyncIterator[bytes]:
+        pieces = self._skeleton()
+        if prefix:
+            yield prefix
+        for piece, (_, source, _) in zip(pieces, self._sources):
+            yield piece
+            async for chunk in _encode(source):
+                yield chunk
+        yield pieces[-1]
+
+
+def _b64_lines(data: bytes) -> bytes:
+    return b"".join(
+        binascii.b2a_base64(data[i:i + LINE_BYTES], newline=False) + b"\r\n"
+        for i in range(0, len(data), LINE_BYTES)
+    )
+
+
+async def _encode(source: bytes | str) -> AsyncIterator[bytes]:
+    if isinstance(source, (bytes, bytearray)):
+        view = memoryview(source)
+        for i in range(0, len(view), READ_BYTES):
+            yield _b64_lines(view[i:i + READ_BYTES])
+        return
+    fh = await asyncio.to_thread(open, source, "rb")
+    try:
+        while True:
+            data = await asyncio.to_thread(fh.read, READ_BYTES)
+            if not data:
+                break
+            yield _b64_lines(data)
+    finally:
+        fh.close()
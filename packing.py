@@ -0,0 +1,75 @@
+import asyncio
+import mimetypes
+import os
+import zipfile
+
+import cpu_pool
+from mime_stream import encoded_size
+
+# заголовки MIME-частини вкладення (Content-Type, Disposition, межа тощо)
+PART_OVERHEAD = 300
+
+# формати, які вже стиснені — zip їм нічого не дасть
+_PACKED_EXT = {
+    ".zip", ".rar", ".7z", ".gz", ".bz2", ".xz",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic",
+    ".mp3", ".ogg", ".m4a", ".mp4", ".mov", ".avi", ".mkv",
+}
+
+
+def part_size(name: str, size: int) -> int:
+    return encoded_size(size) + PART_OVERHEAD + 3 * len(name.encode())
+
+
+def pack(sizes: list[int], capacity: int) -> list[list[int]]:
+    """Розкладає вкладення (за їх закодованим розміром) по мінімуму листів.
+
+    First-fit decreasing; повертає індекси вкладень для кожного листа у
+    початковому порядку. Вкладення, більше за ``capacity``, йде окремим листом.
+    """
+    bins: list[tuple[int, list[int]]] = []  # (вільне місце, індекси)
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+        for n, (free, idx) in enumerate(bins):
+            if sizes[i] <= free:
+                idx.append(i)
+                bins[n] = (free - sizes[i], idx)
+                break
+        else:
+            bins.append((capacity - sizes[i], [i]))
+    groups = [sorted(idx) for _, idx in bins]
+    return sorted(groups, key=lambda g: g[0]) or [[]]
+
+
+def part_subject(subject: str, i: int, total: int) -> str:
+    """Тема ``i``-ї (з нуля) частини листа; одна частина — без суфікса."""
+    return subject if total == 1 else f"{subject} (частина {i + 1}/{total})"
+
+
+def zippable(name: str) -> bool:
+    ext = os.path.splitext(name)[1].lower()
+    ctype = mimetypes.guess_type(name)[0] or ""
+    return ext not in _PACKED_EXT and not ctype.startswith(("image/", "audio/", "video/"))
+
+
+def _zip_file(src: str, dest: str, arcname: str) -> int:
+    with zipfile.ZipFile(dest, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        zf.write(src, arcname=arcname)
+    return os.path.getsize(dest)
+
+
+async def zip_documents(files: list[dict]) -> list[dict]:
+    """Стискає документи в zip у пулі процесів; повертає новий список вкладень.
+
+    Zip лишається лише там, де він справді менший за оригінал.
+    """
+    async def one(f):
+        if not isinstance(f, dict) or not zippable(f["name"]):
+            return f
+        dest = f["path"] + ".zip"
+        size = await cpu_pool.run(_zip_file, f["path"], dest, f["name"])
+        if size < os.path.getsize(f["path"]):
+            return {"name": f["name"] + ".zip", "path": dest}
+        os.remove(dest)
+        return f
+
+    return list(await asyncio.gather(*(one(f) for f in files)))
@@ -0,0 +1,137 @@
+import json
+import os
+from dataclasses import dataclass, field
+
+# типи листів, за якими можна маршрутизувати; дайджест іде за типами своїх елементів
+KINDS = frozenset({"zayavka", "toemail", "mail"})
+DEFAULT = "default"
+
+
+class DeliveryError(Exception):
+    """Лист не дійшов до частини адресатів; ``delivered`` — ті, кому дійшов."""
+
+    def __init__(self, failures: dict[str, BaseException], delivered: list[str]):
+        parts = [f"{name} — {type(e).__name__}: {e}" for name, e in failures.items()]
+        if delivered:
+            parts.append("доставлено: " + ", ".join(delivered))
+        super().__init__("; ".join(parts))
+        self.failures = failures
+        self.delivered = delivered
+
+
+@dataclass(frozen=True)
+class Destination:
+    name: str
+    to: tuple[str, ...]
+    mail_from: str
+    host: str
+    port: int
+    user: str | None = None
+    password: str | None = None
+    security: str | None = None  # ssl / starttls / none; None — за портом
+    verify_tls: bool = True
+
+    @property
+    def server(self) -> tuple:
+        # адресати з однаковим сервером і логіном ділять один пул сесій
+        return self.host, self.port, self.user, self.security, self.verify_tls
+
+
+@dataclass(frozen=True)
+class Route:
+    destinations: tuple[str, ...]
+    chats: frozenset[int] = frozenset()   # порожньо — будь-який чат
+    kinds: frozenset[str] = frozenset()   # порожньо — будь-який тип
+    shops: tuple[str, ...] = ()           # підрядки адреси ТТ (у нижньому регістрі)
+
+    def matches(self, chat_id: int, kind: str, shop_addr: str) -> bool:
+        if self.chats and chat_id not in self.chats:
+            return False
+        if self.kinds and kind not in self.kinds:
+            return False
+        if self.shops:
+            addr = shop_addr.lower()
+            return any(s in addr for s in self.shops)
+        return True
+
+
+@dataclass(frozen=True)
+class RoutingTable:
+    """Куди слати лист: перше правило, що збіглося, інакше ``DEFAULT``."""
+
+    destinations: dict[str, Destination]
+    routes: tuple[Route, ...] = ()
+    fallback: tuple[str, ...] = field(default=(DEFAULT,))
+
+    def resolve(self, chat_id: int, kind: str, shop_addr: str = "") -> list[str]:
+        for route in self.routes:
+            if route.matches(chat_id, kind, shop_addr or ""):
+                return list(route.destinations)
+        return list(self.fallback)
+
+
+def _addresses(value) -> tuple[str, ...]:
+    if isinstance(value, str):
+        value = value.split(",")
+    return tuple(a.strip() for a in value if a and a.strip())
+
+
+def load_routing(path: str | None, default: Destination) -> RoutingTable:
+    """JSON-таблиця маршрутів; без файлу — лише ``default`` з env.
+
+    ``{"destinations": {"kyiv": {"to": [...], "host": ..., "port": ..., "user": ...,
+    "password_env": "KYIV_SMTP_PASS"}}, "routes": [{"chats": [...], "kinds": ["zayavka"],
+    "shop": ["Київ"], "to": ["kyiv", "crm"]}], "default": ["default"]}``.
+    Поля сервера, яких немає в адресата, беруться з ``default``. Адресати з тим
+    самим сервером і логіном ділять сесії, тож пароль у них має збігатися.
+    """
+    destinations = {DEFAULT: default}
+    if not path:
+        return RoutingTable(destinations)
+    with open(path, encoding="utf-8") as fh:
+        raw = json.load(fh)
+
+    for name, d in raw.get("destinations", {}).items():
+        same_server = "host" not in d or d["host"] == default.host
+        password = os.getenv(d["password_env"]) if d.get("password_env") else d.get("password")
+        destinations[name] = Destination(
+            name=name,
+            to=_addresses(d["to"]),
+            mail_from=d.get("from") or (default.mail_from if same_server else d.get("user") or default.mail_from),
+            host=d.get("host", default.host),
+            port=int(d.get("port", default.port)),
+            user=d.get("user", default.user if same_server else None),
+            password=password if password is not None else (default.password if same_server else None),
+            security=d.get("security", default.security if same_server else None),
+            verify_tls=bool(d.get("verify_tls", default.verify_tls)),
+        )
+
+    # пул сесій ключується сервером і логіном — різні паролі там означали б чужий пароль
+    passwords: dict[tuple, Destination] = {}
+    for dest in destinations.values():
+        first = passwords.setdefault(dest.server, dest)
+        if first.password != dest.password:
+            raise ValueError(
+                f"адресати {first.name} і {dest.name}: той самий сервер і логін, але різні паролі"
+            )
+
+    routes = []
+    for r in raw.get("routes", []):
+        names = tuple(_addresses(r["to"]))
+        unknown = [n for n in names if n not in destinations]
+        if unknown:
+            raise ValueError(f"маршрут на невідомих адресатів: {', '.join(unknown)}")
+        kinds = frozenset(r.get("kinds", ()))
+        if kinds - KINDS:
+            raise ValueError(f"невідомі типи листів: {', '.join(sorted(kinds - KINDS))}")
+        shops = r.get("shop", ())
+        routes.append(Route(
+            destinations=names,
+            chats=frozenset(int(c) for c in r.get("chats", ())),
+            kinds=kinds,
+            shops=tuple(s.lower() for s in ([shops] if isinstance(shops, str) else shops)),
+        ))
+    fallback = tuple(_addresses(raw.get("default", [DEFAULT])))
+    if any(n not in destinations for n in fallback):
+        raise ValueError("default посилається на невідомого адресата")
+    return RoutingTable(destinations, tuple(routes), fallback)
@@ -0,0 +1,132 @@
+import asyncio
+import time
+from typing import Callable
+
+from aiosmtp import SMTPConnection, SMTPDisconnected, make_tls_context
+
+
+class SMTPPool:
+    """Пул автентифікованих SMTP-сесій.
+
+    Сесії повертаються в пул після листа і перевикористовуються: якщо сесія
+    простоювала довше за ``noop_after`` — перед видачею перевіряємо її NOOP,
+    довше за ``idle_ttl`` — закриваємо й відкриваємо нову. Одночасно живих
+    сесій не більше ``max_size``.
+
+    ``on_timing(phase, seconds)`` отримує тривалість фаз нових сесій
+    (connect, tls, auth) і кожної відправки (transfer).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str | None,
+        password: str | None,
+        max_size: int = 4,
+        idle_ttl: float = 60.0,
+        noop_after: float = 10.0,
+        timeout: float = 30.0,
+        verify_tls: bool = True,
+        security: str | None = None,
+        on_timing: Callable[[str, float], None] | None = None,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.noop_after = noop_after
+        self.timeout = timeout
+        self.security = security
+        self.on_timing = on_timing
+        self._ctx = make_tls_context(verify_tls)
+        self._idle: list[tuple[SMTPConnection, float]] = []  # (сесія, час повернення), LIFO
+        self.size_limit: int | None = None  # SIZE з EHLO сервера
+        self._size_known = False
+        self._slots = asyncio.Semaphore(max_size)
+
+    async def _connect(self) -> SMTPConnection:
+        conn = SMTPConnection(self.host, self.port, self._ctx, timeout=self.timeout, security=self.security)
+        await conn.connect()
+        try:
+            if self.user:
+                await conn.login(self.user, self.password or "")
+        except BaseException:
+            conn.close()
+            raise
+        if conn.tls_session is not None:
+            self._ctx.session = conn.tls_session
+        self._report(conn, ("connect", "tls", "auth"))
+        self.size_limit = conn.max_size
+        self._size_known = True
+        return conn
+
+    async def _healthy(self, conn: SMTPConnection, released_at: float) -> bool:
+        idle = time.monotonic() - released_at
+        if idle > self.idle_ttl or not conn.connected:
+            return False
+        if idle < self.noop_after:
+            return True
+        try:
+            await conn.noop()
+            return True
+        except Exception:
+            return False
+
+    async def _checkout(self) -> tuple[SMTPConnection, bool]:
+        while self._idle:
+            conn, released_at = self._idle.pop()
+            if await self._healthy(conn, released_at):
+                return conn, True
+            conn.close()
+        return await self._connect(), False
+
+    def _report(self, conn: SMTPConnection, phases: tuple[str, ...]):
+        if self.on_timing is None:
+            return
+        for phase in phases:
+            if phase in conn.timings:
+                self.on_timing(phase, conn.timings[phase])
+
+    def _checkin(self, conn: SMTPConnection):
+        if conn.connected:
+            self._idle.append((conn, time.monotonic()))
+
+    async def message_size_limit(self) -> int | None:
+        """Максимальний розмір листа, який оголошує сервер (None — не обмежено)."""
+        if not self._size_known:
+            async with self._slots:
+                conn, _ = await self._checkout()
+                self._checkin(conn)
+        return self.size_limit
+
+    async def sendmail(self, mail_from: str, rcpt_to: list[str], make_chunks, size: int | None = None):
+        """``make_chunks(conn)`` повертає вміст листа — bytes або (a)iterable чанків.
+
+        Фабрика, а не готовий ітератор: якщо сервер закрив сесію, поки вона
+        лежала в пулі, лист відправляється ще раз через нову сесію.
+        """
+        async with self._slots:
+            conn, reused = await self._checkout()
+            try:
+                try:
+                    refused = await conn.sendmail(mail_from, rcpt_to, make_chunks(conn), size)
+                except SMTPDisconnected:
+                    conn.close()
+                    if not reused:
+                        raise
+                    conn = await self._connect()
+                    refused = await conn.sendmail(mail_from, rcpt_to, make_chunks(conn), size)
+                self._report(conn, ("transfer",))
+            except BaseException:
+                # стан сесії після помилки невідомий — не повертаємо її в пул
+                conn.close()
+                raise
+            self._checkin(conn)
+            return refused
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(conn.quit() for conn, _ in idle), return_exceptions=True)
@@ -1,29 +1,297 @@
-import os, ssl, smtplib
+"""Діагностика SMTP: затримки кожної фази, можливості сервера й ліміт сесій.
+
+Ходить тим самим клієнтом, що й бот (``aiosmtp.SMTPConnection``), і бере
+SMTP_* з .env. Приклади::
+
+    python smtp_test.py                         # 5 повторів, без відправки листа
+    python smtp_test.py -n 20 --send-to me@example.com --size-kb 512
+    python smtp_test.py --sessions 20           # скільки сесій тримає провайдер
+    python smtp_test.py --candidates            # який логін приймає сервер
+    python smtp_test.py --host 127.0.0.1 --port 2525 --security none   # проти bench/smtp_sink.py
+
+Кожен повтор — два з'єднання: перше з повним TLS-handshake (на ньому ж
+міряються EHLO, AUTH і DATA), друге — з TLS-сесією першого (resumption).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import time
+from email.message import EmailMessage
+
 from dotenv import load_dotenv
 
-load_dotenv()
+from aiosmtp import SMTPConnection, SMTPError, make_tls_context
+from mime_stream import StreamingMessage
+
+PHASES = ("dns", "tcp", "tls_full", "tls_resumed", "banner", "ehlo", "auth", "data", "quit")
+REPORTED_EXT = ("size", "pipelining", "chunking", "8bitmime", "smtputf8", "auth", "starttls")
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+class Profiler:
+    def __init__(self, args):
+        self.args = args
+        self.samples: dict[str, list[float]] = {p: [] for p in PHASES}
+        self.errors: list[str] = []
+        self.extensions: dict[str, str] = {}
+        self.plain_extensions: dict[str, str] = {}  # до STARTTLS
+        self.resumed = 0
+        self.user = args.user
+
+    def _add(self, phase: str, started: float):
+        self.samples[phase].append(time.perf_counter() - started)
+
+    async def resolve(self) -> str:
+        started = time.perf_counter()
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            self.args.host, self.args.port, type=socket.SOCK_STREAM
+        )
+        self._add("dns", started)
+        return infos[0][4][0]
+
+    async def open(self, address: str, ctx=None, tls_phase: str = "tls_full") -> SMTPConnection:
+        """TCP, TLS і EHLO вручну, щоб кожна фаза мала свій час."""
+        a = self.args
+        conn = SMTPConnection(address, a.port, ctx or make_tls_context(a.verify), timeout=a.timeout,
+                              security=a.security, server_hostname=a.host)
+        started = time.perf_counter()
+        await conn.connect_tcp()
+        self._add("tcp", started)
+        try:
+            if conn.security == "ssl":
+                started = time.perf_counter()
+                await conn.tls_handshake()
+                self._add(tls_phase, started)
+            started = time.perf_counter()
+            await conn.greet()
+            self._add("banner", started)
+            started = time.perf_counter()
+            await conn.ehlo()
+            self._add("ehlo", started)
+            if conn.security == "starttls":
+                self.plain_extensions = conn.extensions
+                started = time.perf_counter()
+                await conn.starttls()
+                self._add(tls_phase, started)
+                await conn.ehlo()
+        except BaseException:
+            conn.close()
+            raise
+        if tls_phase == "tls_resumed":
+            sslobj = conn.writer.get_extra_info("ssl_object")
+            self.resumed += bool(sslobj is not None and sslobj.session_reused)
+        return conn
+
+    async def login(self, conn: SMTPConnection):
+        if self.user:
+            started = time.perf_counter()
+            await conn.login(self.user, self.args.password)
+            self._add("auth", started)
+
+    async def round(self, message: StreamingMessage | None):
+        a = self.args
+        address = await self.resolve()
+        ctx = make_tls_context(a.verify)  # свіжий контекст — гарантовано повний handshake
+        conn = await self.open(address, ctx)
+        try:
+            self.extensions = conn.extensions
+            await self.login(conn)
+            if message is not None:
+                started = time.perf_counter()
+                await conn.sendmail(a.mail_from, [a.send_to], message.chunks(), message.size)
+                self._add("data", started)
+            session = conn.tls_session  # квиток TLS 1.3 приходить уже після handshake
+        finally:
+            started = time.perf_counter()
+            await conn.quit()
+            self._add("quit", started)
+
+        if conn.security != "none" and session is not None:
+            ctx.session = session
+            again = await self.open(address, ctx, tls_phase="tls_resumed")
+            await again.quit()
 
-host = os.getenv("SMTP_HOST", "smtp.ukr.net").strip()
-port = int(os.getenv("SMTP_PORT", "465"))
-user_env = os.getenv("SMTP_USER", "").strip()
-pwd = os.getenv("SMTP_PASS", "").strip()
+    async def run(self) -> dict:
+        a = self.args
+        message = _test_message(a) if a.send_to else None
+        for i in range(a.repeat):
+            try:
+                await self.round(message)
+            except (OSError, asyncio.TimeoutError, SMTPError) as e:
+                self.errors.append(f"#{i + 1}: {type(e).__name__}: {e}")
+            if a.pause and i + 1 < a.repeat:
+                await asyncio.sleep(a.pause)
+        return self.report()
 
-candidates = [user_env]
-if "@" in user_env:
-    candidates.append(user_env.split("@")[0])  # спробуємо без домену
+    def report(self) -> dict:
+        phases = {}
+        for phase, values in self.samples.items():
+            if values:
+                phases[phase] = {
+                    "n": len(values),
+                    **{f"p{p}": round(percentile(values, p) * 1000, 1) for p in (50, 95, 99)},
+                    "max": round(max(values) * 1000, 1),
+                }
+        ext = {k: self.extensions.get(k, None) for k in REPORTED_EXT if k != "starttls"}
+        ext["starttls"] = "starttls" in self.plain_extensions or None
+        size = self.extensions.get("size", "")
+        return {
+            "server": f"{self.args.host}:{self.args.port}",
+            "phases_ms": phases,
+            "tls_resumed": f"{self.resumed}/{len(self.samples['tls_resumed'])}",
+            "extensions": {k: (v if v != "" else True) for k, v in ext.items() if v is not None},
+            "size_limit": int(size) if size.isdigit() and int(size) > 0 else None,
+            "errors": self.errors,
+        }
 
-print("SMTP_HOST:", host, "PORT:", port)
-print("USER candidates:", candidates)
 
-def try_login(user):
+def _test_message(a) -> StreamingMessage:
+    msg = EmailMessage()
+    msg["From"] = a.mail_from
+    msg["To"] = a.send_to
+    msg["Subject"] = "smtp_test: перевірка затримок"
+    msg.set_content("Тестовий лист від smtp_test.py, можна видалити.")
+    stream = StreamingMessage(msg)
+    if a.size_kb:
+        stream.add_attachment(os.urandom(a.size_kb * 1024), "application", "octet-stream", "probe.bin")
+    return stream
+
+
+async def probe_sessions(a, user: str | None) -> dict:
+    """Відкриває сесії по одній і тримає їх, доки сервер не відмовить або не дійде до ``--sessions``."""
+    prof = Profiler(a)
+    prof.user = user
+    address = await prof.resolve()
+    opened: list[SMTPConnection] = []
+    refusal = None
     try:
-        with smtplib.SMTP_SSL(host, port, context=ssl.create_default_context()) as s:
-            s.login(user, pwd)
-        print(f"[OK] Увійшли як: {user!r}")
-    except smtplib.SMTPAuthenticationError as e:
-        print(f"[FAIL] {user!r}: SMTPAuthenticationError -> {e.smtp_code} {e.smtp_error!r}")
-    except Exception as e:
-        print(f"[FAIL] {user!r}: {type(e).__name__} -> {e!r}")
-
-for u in candidates:
-    try_login(u)
+        for _ in range(a.sessions):
+            try:
+                conn = await prof.open(address)
+                try:
+                    await prof.login(conn)
+                except BaseException:
+                    await conn.quit()
+                    raise
+            except (OSError, asyncio.TimeoutError, SMTPError) as e:
+                refusal = f"{type(e).__name__}: {e}"
+                break
+            opened.append(conn)
+            if a.pause:
+                await asyncio.sleep(a.pause)
+    finally:
+        accepted = len(opened)
+        await asyncio.gather(*(c.quit() for c in opened))
+    # max_sessions — виміряне; запас (--margin) віднімається лише в рекомендації для SMTP_POOL_SIZE
+    return {
+        "max_sessions": accepted,
+        "refused": refusal,
+        "limit_reached": refusal is not None,
+        "margin": a.margin,
+        "recommended_pool": max(accepted - a.margin, 1) if refusal else accepted,
+    }
+
+
+async def check_candidates(a) -> str | None:
+    """Старий режим: пробує SMTP_USER і його частину до @, повертає той, що підійшов."""
+    candidates = [a.user]
+    if "@" in a.user:
+        candidates.append(a.user.split("@")[0])  # спробуємо без домену
+    print("USER candidates:", candidates)
+    found = None
+    for user in candidates:
+        prof = Profiler(a)
+        try:
+            conn = await prof.open(await prof.resolve())
+            try:
+                await conn.login(user, a.password)
+            finally:
+                await conn.quit()
+            print(f"[OK] Увійшли як: {user!r}")
+            found = found or user
+        except SMTPError as e:
+            print(f"[FAIL] {user!r}: {e.code} {e.message!r}")
+        except Exception as e:
+            print(f"[FAIL] {user!r}: {type(e).__name__} -> {e!r}")
+    return found
+
+
+def print_report(r: dict, sessions: dict | None):
+    print(f"\n== {r['server']} ==")
+    print(f"  {'phase':<12}{'n':>4}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}   (ms)")
+    for phase, s in r["phases_ms"].items():
+        print(f"  {phase:<12}{s['n']:>4}{s['p50']:>9}{s['p95']:>9}{s['p99']:>9}{s['max']:>9}")
+    if r["phases_ms"].get("tls_resumed"):
+        print(f"  TLS sessions actually resumed: {r['tls_resumed']}")
+    print("  extensions:  " + (", ".join(
+        k.upper() if v is True else f"{k.upper()} {v}" for k, v in r["extensions"].items()) or "—"))
+    print(f"  SIZE limit:  {r['size_limit'] or 'not advertised'}")
+    for err in r["errors"]:
+        print(f"  error {err}")
+    if sessions:
+        print_sessions(sessions)
+
+
+def print_sessions(s: dict):
+    if s["limit_reached"]:
+        print(f"  sessions:    {s['max_sessions']} accepted, #{s['max_sessions'] + 1} refused: {s['refused']}")
+        print(f"               SMTP_POOL_SIZE <= {s['recommended_pool']} (margin {s['margin']})")
+    else:
+        print(f"  sessions:    {s['max_sessions']} accepted, no refusal up to --sessions")
+
+
+async def main(a) -> int:
+    if a.candidates:
+        a.user = await check_candidates(a) or a.user
+    report = await Profiler(a).run() if a.repeat else None
+    sessions = await probe_sessions(a, a.user) if a.sessions else None
+    if report:
+        print_report(report, sessions)
+    elif sessions:
+        print_sessions(sessions)
+    if a.json:
+        with open(a.json, "w", encoding="utf-8") as fh:
+            json.dump({"profile": report, "sessions": sessions}, fh, ensure_ascii=False, indent=2)
+    return 1 if report and len(report["errors"]) == a.repeat else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    # типові значення — з env, тож load_dotenv() має бути викликаний раніше
+    user = os.getenv("SMTP_USER", "").strip()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("SMTP_HOST", "smtp.ukr.net").strip())
+    parser.add_argument("--port", type=int, default=int(os.getenv("SMTP_PORT", "465")))
+    parser.add_argument("--security", choices=["ssl", "starttls", "none"], default=os.getenv("SMTP_SECURITY") or None,
+                        help="типово — за портом, як у бота")
+    parser.add_argument("--insecure", dest="verify", action="store_false",
+                        default=os.getenv("SMTP_TLS_VERIFY", "1") != "0", help="не перевіряти сертифікат")
+    parser.add_argument("--user", default=user, help="порожній — без AUTH")
+    parser.add_argument("--password", default=os.getenv("SMTP_PASS", "").strip())
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="скільки повторів (0 — лише --sessions)")
+    parser.add_argument("--pause", type=float, default=0.0, help="пауза між повторами/сесіями, с")
+    parser.add_argument("--send-to", help="надсилати тестовий лист сюди, щоб заміряти DATA")
+    parser.add_argument("--mail-from", default=os.getenv("MAIL_FROM", user))
+    parser.add_argument("--size-kb", type=int, default=0, help="розмір тестового вкладення")
+    parser.add_argument("--sessions", type=int, default=0, help="до скількох одночасних сесій нарощувати")
+    parser.add_argument("--margin", type=int, default=1,
+                        help="на скільки сесій менше за виміряну межу радити SMTP_POOL_SIZE")
+    parser.add_argument("--candidates", action="store_true", help="перебрати варіанти логіна (з доменом і без)")
+    parser.add_argument("--json", help="куди записати результат")
+    return parser
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    sys.exit(asyncio.run(main(build_parser().parse_args())))
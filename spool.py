@@ -0,0 +1,146 @@
+import asyncio
+import mimetypes
+import os
+import shutil
+import time
+import uuid
+
+from aiogram import Bot
+
+from file_cache import FileCache
+
+
+class SpoolQuotaExceeded(Exception):
+    pass
+
+
+class AttachmentSpool:
+    """Тимчасові файли вкладень на диску, по каталогу на сесію.
+
+    Файл качається з Telegram потоком одразу в ``<root>/<session>/``, а в
+    FSM лишається тільки маленький handle ``{"name", "path", "size", "mime", "uid"}``.
+    Обсяг обмежено квотою на сесію і загальною квотою; каталоги сесій, які
+    ніхто не звільнив, прибирає фоновий reaper після ``ttl`` секунд.
+    """
+
+    def __init__(self, root: str, session_quota: int, global_quota: int, ttl: float,
+                 cache: FileCache | None = None):
+        self.root = root
+        self.cache = cache
+        self.session_quota = session_quota
+        self.global_quota = global_quota
+        self.ttl = ttl
+        os.makedirs(root, exist_ok=True)
+        self._usage: dict[str, int] = {}
+        for session in os.listdir(root):
+            self._usage[session] = _dir_size(os.path.join(root, session))
+        self._reaper: asyncio.Task | None = None
+
+    @property
+    def total(self) -> int:
+        return sum(self._usage.values())
+
+    def _reserve(self, session: str, size: int):
+        used = self._usage.get(session, 0)
+        if used + size > self.session_quota:
+            raise SpoolQuotaExceeded(f"ліміт вкладень на заявку {self.session_quota // 2**20} МБ")
+        if self.total + size > self.global_quota:
+            raise SpoolQuotaExceeded("сервер тимчасово переповнений вкладеннями")
+        self._usage[session] = used + size
+
+    def _unreserve(self, session: str, size: int):
+        left = self._usage.get(session, 0) - size
+        if left > 0:
+            self._usage[session] = left
+        else:
+            self._usage.pop(session, None)
+
+    async def download(self, bot: Bot, session: str, file_id: str, name: str,
+                       mime: str | None = None, size: int | None = None,
+                       unique_id: str | None = None) -> dict:
+        expected = size or 0
+        self._reserve(session, expected)
+        sdir = os.path.join(self.root, session)
+        os.makedirs(sdir, exist_ok=True)
+        path = os.path.join(sdir, uuid.uuid4().hex)
+        try:
+            if self.cache and unique_id:
+                await self.cache.copy_to(bot, file_id, unique_id, path + ".part")
+            else:
+                await bot.download(file_id, destination=path + ".part")
+            os.replace(path + ".part", path)
+            real = os.path.getsize(path)
+        except BaseException:
+            self._unreserve(session, expected)
+            _unlink(path + ".part")
+            raise
+        # file_size від Telegram може бути відсутнім — коригуємо резерв за фактом
+        self._unreserve(session, expected)
+        try:
+            self._reserve(session, real)
+        except SpoolQuotaExceeded:
+            _unlink(path)
+            raise
+        os.utime(sdir)
+        return {
+            "name": name,
+            "path": path,
+            "size": real,
+            "mime": mime or mimetypes.guess_type(name)[0] or "application/octet-stream",
+            "uid": unique_id,  # file_unique_id: стабільний між ботами й перезапусками
+        }
+
+    def resize(self, session: str, delta: int):
+        # файл сесії змінився на місці (напр. перестиснуте фото)
+        if delta < 0:
+            self._unreserve(session, -delta)
+        elif delta > 0:
+            self._usage[session] = self._usage.get(session, 0) + delta
+
+    def release(self, session: str):
+        self._usage.pop(session, None)
+        shutil.rmtree(os.path.join(self.root, session), ignore_errors=True)
+
+    def _expired(self) -> list[str]:
+        cutoff = time.time() - self.ttl
+        out = []
+        for session in os.listdir(self.root):
+            try:
+                if os.path.getmtime(os.path.join(self.root, session)) < cutoff:
+                    out.append(session)
+            except OSError:
+                pass
+        return out
+
+    async def _reap_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            for session in await asyncio.to_thread(self._expired):
+                self.release(session)
+
+    def start(self, interval: float = 600.0):
+        self._reaper = asyncio.create_task(self._reap_loop(interval))
+
+    async def stop(self):
+        if self._reaper:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+            self._reaper = None
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, names in os.walk(path):
+        for n in names:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, n))
+            except OSError:
+                pass
+    return total
+
+
+def _unlink(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
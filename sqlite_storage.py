@@ -0,0 +1,134 @@
+import asyncio
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key     TEXT PRIMARY KEY,
+    state   TEXT,
+    data    TEXT NOT NULL,
+    updated REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS fsm_updated ON fsm (updated);
+"""
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-сховище у SQLite (WAL) з LRU-кешем читання.
+
+    Стан і дані кожної пари (chat, user) лежать одним рядком у компактному
+    JSON, тож незавершені заявки переживають рестарт. Записи, не змінені
+    довше за ``ttl`` секунд, вважаються покинутими і видаляються. У пам'яті
+    тримається не більше ``cache_size`` останніх записів.
+    """
+
+    def __init__(self, path: str, ttl: float = 6 * 3600, cache_size: int = 1024):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        # key -> (state, data у вигляді JSON, час зміни)
+        self._cache: "OrderedDict[str, tuple[str | None, str, float]]" = OrderedDict()
+        self._reaper: asyncio.Task | None = None
+        self._closed = False
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+        if key.thread_id:
+            parts.append(f"t{key.thread_id}")
+        if key.business_connection_id:
+            parts.append(f"b{key.business_connection_id}")
+        if key.destiny != "default":
+            parts.append(key.destiny)
+        return ":".join(parts)
+
+    def _load(self, k: str) -> tuple[str | None, str, float]:
+        rec = self._cache.get(k)
+        if rec is None:
+            row = self._db.execute("SELECT state, data, updated FROM fsm WHERE key = ?", (k,)).fetchone()
+            rec = (row[0], row[1], row[2]) if row else (None, "{}", 0.0)
+        if rec[2] and rec[2] < time.time() - self.ttl:
+            self._store(k, None, "{}")
+            rec = (None, "{}", 0.0)
+        self._remember(k, rec)
+        return rec
+
+    def _remember(self, k: str, rec: tuple[str | None, str, float]):
+        self._cache[k] = rec
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _store(self, k: str, state: str | None, data: str):
+        if state is None and data == "{}":
+            self._db.execute("DELETE FROM fsm WHERE key = ?", (k,))
+            self._remember(k, (None, "{}", 0.0))
+            return
+        now = time.time()
+        self._db.execute(
+            "INSERT INTO fsm (key, state, data, updated) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, "
+            "updated = excluded.updated",
+            (k, state, data, now),
+        )
+        self._remember(k, (state, data, now))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = self._key(key)
+        _, data, _ = self._load(k)
+        self._store(k, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return self._load(self._key(key))[0]
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        k = self._key(key)
+        state, _, _ = self._load(k)
+        self._store(k, state, json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        # щоразу новий dict із JSON — зміни у викликача не псують кеш
+        return json.loads(self._load(self._key(key))[1])
+
+    def count_states(self) -> dict[str, int]:
+        # скільки живих записів у кожному стані (для метрик)
+        cutoff = time.time() - self.ttl
+        rows = self._db.execute(
+            "SELECT state, COUNT(*) FROM fsm WHERE state IS NOT NULL AND updated >= ? GROUP BY state",
+            (cutoff,),
+        ).fetchall()
+        return dict(rows)
+
+    def _expire(self) -> int:
+        cutoff = time.time() - self.ttl
+        cur = self._db.execute("DELETE FROM fsm WHERE updated < ?", (cutoff,))
+        for k in [k for k, rec in self._cache.items() if rec[2] and rec[2] < cutoff]:
+            self._cache.pop(k, None)
+        return cur.rowcount
+
+    async def _reap_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self._expire()
+
+    def start(self, interval: float = 600.0):
+        self._expire()
+        self._reaper = asyncio.create_task(self._reap_loop(interval))
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._reaper:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+        self._db.close()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# модулі бота лежать у корені, стенд — у bench/ (без пакетів)
+sys.path[:0] = [ROOT, os.path.join(ROOT, "bench")]
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+
+from access import AccessControl, compile_policy
+
+GROUP, OTHER, PRIVATE_GROUP = -100, -200, -300
+AGENT, BOSS, STRANGER = 1, 2, 3
+
+
+def test_empty_policy_allows_any_group():
+    policy = compile_policy()
+    assert policy.allows(OTHER, STRANGER)
+    assert policy.allows(OTHER, None)
+
+
+def test_chats_and_users():
+    policy = compile_policy([GROUP], [AGENT])
+    assert policy.allows(GROUP, AGENT)
+    assert not policy.allows(GROUP, STRANGER)
+    assert not policy.allows(GROUP, None)  # анонімний адмін чи канал
+    assert not policy.allows(OTHER, AGENT)
+
+
+def test_chats_without_users_allow_everyone_there():
+    policy = compile_policy([GROUP])
+    assert policy.allows(GROUP, STRANGER)
+    assert not policy.allows(OTHER, STRANGER)
+
+
+def test_chat_users_override_users_for_their_group():
+    policy = compile_policy([GROUP], [AGENT], {PRIVATE_GROUP: [BOSS]})
+    assert policy.allows(PRIVATE_GROUP, BOSS)  # група з chat_users дозволена й поза chats
+    assert not policy.allows(PRIVATE_GROUP, AGENT)
+    assert policy.allows(GROUP, AGENT)
+    assert not policy.allows(GROUP, BOSS)
+
+
+def test_only_chat_users_is_a_group_allow_list():
+    policy = compile_policy(chat_users={PRIVATE_GROUP: [BOSS]})
+    assert policy.allows(PRIVATE_GROUP, BOSS)
+    assert not policy.allows(PRIVATE_GROUP, STRANGER)
+    assert not policy.allows(OTHER, STRANGER)
+
+
+def _write(path, raw: str, mtime: float):
+    path.write_text(raw, encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_reload_valid_file(tmp_path):
+    path = tmp_path / "access.json"
+    _write(path, json.dumps({"chats": [GROUP]}), 1000)
+    control = AccessControl(compile_policy([OTHER]), str(path))
+    assert control.policy.chats == {GROUP}
+
+    _write(path, json.dumps({"chats": [OTHER], "chat_users": {str(GROUP): [AGENT]}}), 2000)
+    assert control.reload()
+    assert control.policy.allows(GROUP, AGENT)
+    assert not control.policy.allows(GROUP, STRANGER)
+    assert control.policy.allows(OTHER, STRANGER)
+
+
+def test_broken_file_keeps_previous_policy(tmp_path):
+    path = tmp_path / "access.json"
+    _write(path, json.dumps({"chats": [GROUP]}), 1000)
+    control = AccessControl(compile_policy(), str(path))
+    before = control.policy
+
+    for broken in ('{"chats": [', '{"chats": ["not-a-number"]}', "[1, 2]"):
+        _write(path, broken, 2000)
+        assert not control.reload()
+        assert control.policy is before
+    assert not control.policy.allows(OTHER, STRANGER)
+
+
+def test_missing_file_falls_back(tmp_path):
+    path = tmp_path / "access.json"
+    _write(path, json.dumps({"chats": [GROUP]}), 1000)
+    fallback = compile_policy([OTHER])
+    control = AccessControl(fallback, str(path))
+    path.unlink()
+    assert not control.reload()
+    assert control.policy is fallback
+
+
+def test_watcher_picks_up_changed_file(tmp_path):
+    path = tmp_path / "access.json"
+    _write(path, json.dumps({"chats": [GROUP]}), 1000)
+    control = AccessControl(compile_policy(), str(path))
+
+    async def main():
+        control.start(interval=0.01)
+        try:
+            _write(path, json.dumps({"chats": [OTHER]}), 2000)
+            await asyncio.sleep(0.1)
+        finally:
+            await control.stop()
+
+    asyncio.run(main())
+    assert control.policy.chats == {OTHER}
@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from aiosmtp import SMTPConnection, SMTPError
+from smtp_pool import SMTPPool
+from smtp_sink import SMTPSink
+
+MODES = [
+    pytest.param(True, True, id="pipelining+chunking"),
+    pytest.param(True, False, id="pipelining"),
+    pytest.param(False, True, id="chunking"),
+    pytest.param(False, False, id="plain"),
+]
+
+
+def _run(sink: SMTPSink, scenario):
+    async def main():
+        port = await sink.start()
+        conn = SMTPConnection("127.0.0.1", port, security="none", timeout=5)
+        await conn.connect()
+        try:
+            return await scenario(conn)
+        finally:
+            await conn.quit()
+            await sink.stop()
+
+    return asyncio.run(main())
+
+
+def _verbs(sink: SMTPSink) -> list[str]:
+    return [c.split(" ", 1)[0].upper() for c in sink.commands]
+
+
+@pytest.mark.parametrize("pipelining, chunking", MODES)
+def test_dot_stuffing_across_chunk_boundaries(pipelining, chunking):
+    sink = SMTPSink(pipelining=pipelining, chunking=chunking, record=True)
+    chunks = [
+        b"Subject: dots\r\n\r\n",
+        b".leading dot\r\n",                # крапка на початку чанка й рядка
+        b"middle of a line, then", b".dot that is not at line start\r\n",
+        b"line ends here\r\n", b".\r\n",     # самотня крапка не має закінчити DATA
+        b"..two dots\r\n",
+        b"last line\r\n",
+    ]
+
+    async def scenario(conn):
+        return await conn.sendmail("from@example.com", ["to@example.com"], chunks)
+
+    assert _run(sink, scenario) == {}
+    assert sink.received == [("from@example.com", ["to@example.com"], b"".join(chunks))]
+    assert ("DATA" in _verbs(sink)) != chunking
+
+
+@pytest.mark.parametrize("chunking", [True, False])
+def test_envelope_without_pipelining(chunking):
+    sink = SMTPSink(pipelining=False, chunking=chunking, record=True)
+    body = b"Subject: x\r\n\r\nhi\r\n"
+
+    async def scenario(conn):
+        assert not conn.pipelining
+        return await conn.sendmail("from@example.com", ["a@example.com", "b@example.com"], body, len(body))
+
+    assert _run(sink, scenario) == {}
+    verbs = _verbs(sink)
+    start = verbs.index("MAIL")
+    assert verbs[start:start + 4] == ["MAIL", "RCPT", "RCPT", "BDAT" if chunking else "DATA"]
+    assert sink.commands[start] == f"MAIL FROM:<from@example.com> SIZE={len(body)} BODY=8BITMIME"
+    assert sink.received[0][1] == ["a@example.com", "b@example.com"]
+
+
+@pytest.mark.parametrize("pipelining, chunking", MODES)
+def test_partial_rcpt_refusal_returns_refused(pipelining, chunking):
+    sink = SMTPSink(pipelining=pipelining, chunking=chunking, refuse={"bad@example.com"}, record=True)
+
+    async def scenario(conn):
+        return await conn.sendmail("from@example.com", ["good@example.com", "bad@example.com"], b"hi\r\n")
+
+    refused = _run(sink, scenario)
+    assert list(refused) == ["bad@example.com"]
+    assert refused["bad@example.com"][0] == 550
+    assert [r[1] for r in sink.received] == [["good@example.com"]]
+
+
+@pytest.mark.parametrize("pipelining, chunking", MODES)
+def test_all_rcpts_refused_aborts_and_keeps_session(pipelining, chunking):
+    sink = SMTPSink(pipelining=pipelining, chunking=chunking, refuse={"x@example.com", "y@example.com"}, record=True)
+
+    async def scenario(conn):
+        with pytest.raises(SMTPError) as e:
+            await conn.sendmail("from@example.com", ["x@example.com", "y@example.com"], b"lost\r\n")
+        assert (e.value.code, e.value.command) == (550, "RCPT")
+        # сесія скинута через RSET і придатна для наступного листа
+        assert conn.connected
+        await conn.sendmail("from@example.com", ["ok@example.com"], b"next\r\n")
+
+    _run(sink, scenario)
+    assert [r[2] for r in sink.received] == [b"next\r\n"]
+    verbs = _verbs(sink)
+    assert "RSET" in verbs
+    if not pipelining:
+        # без PIPELINING тіло не відкривається, якщо отримувачів немає
+        assert not {"DATA", "BDAT"} & set(verbs[:verbs.index("RSET")])
+
+
+def test_bdat_marks_last_chunk():
+    sink = SMTPSink(chunking=True, record=True)
+
+    async def chunks():
+        for piece in (b"Subject: bdat\r\n\r\n", b"", b".no stuffing\r\n", b"end\r\n"):
+            yield piece
+
+    async def scenario(conn):
+        await conn.sendmail("from@example.com", ["to@example.com"], chunks())
+
+    _run(sink, scenario)
+    bdat = [c for c in sink.commands if c.startswith("BDAT")]
+    # порожні чанки пропускаються, LAST — лише на останньому
+    assert bdat == ["BDAT 17", "BDAT 14", "BDAT 5 LAST"]
+    assert sink.received[0][2] == b"Subject: bdat\r\n\r\n.no stuffing\r\nend\r\n"
+
+
+def test_pool_reconnects_after_server_dropped_idle_session():
+    sink = SMTPSink(record=True)
+
+    async def main():
+        port = await sink.start()
+        pool = SMTPPool("127.0.0.1", port, "user@example.com", "secret", security="none", timeout=5)
+        try:
+            await pool.sendmail("from@example.com", ["to@example.com"], lambda conn: b"first\r\n")
+            sink.drop()  # сервер закрив сесію, поки вона лежала в пулі
+            await asyncio.sleep(0.05)
+            assert pool._idle and pool._idle[0][0].connected  # клієнт про це ще не знає
+            await pool.sendmail("from@example.com", ["to@example.com"], lambda conn: b"second\r\n")
+        finally:
+            await pool.close()
+            await sink.stop()
+
+    asyncio.run(main())
+    assert [r[2] for r in sink.received] == [b"first\r\n", b"second\r\n"]
+    assert sink.sessions == 2
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+from ledger import BUSY, DONE, SubmissionLedger, submission_key
+
+OWNER = "z1_1"
+
+
+def _key(fullname: str = "Іваненко") -> str:
+    return submission_key(OWNER, {"fullname": fullname}, [{"uid": "AQAD1"}])
+
+
+def test_busy_while_same_owner_is_in_flight(tmp_path):
+    ledger = SubmissionLedger(str(tmp_path / "s.sqlite3"))
+
+    async def main():
+        assert await ledger.begin(OWNER, _key()) is None
+        assert ledger.sending(OWNER)
+        assert await ledger.begin(OWNER, _key()) == BUSY
+        # той самий власник з іншою чернеткою — теж чекає
+        assert await ledger.begin(OWNER, _key("Петренко")) == BUSY
+        ledger.abort(OWNER)
+        assert await ledger.begin(OWNER, _key()) is None
+
+    asyncio.run(main())
+    ledger.close()
+
+
+def test_done_after_complete(tmp_path):
+    ledger = SubmissionLedger(str(tmp_path / "s.sqlite3"))
+
+    async def main():
+        assert await ledger.begin(OWNER, _key()) is None
+        await ledger.complete(OWNER, _key(), job_id=7)
+        assert not ledger.sending(OWNER)
+        assert ledger.recently_sent(OWNER)
+        assert await ledger.begin(OWNER, _key()) == DONE
+        # інша чернетка того ж власника — нова заявка
+        assert await ledger.begin(OWNER, _key("Петренко")) is None
+        ledger.forget(OWNER)
+        assert not ledger.recently_sent(OWNER)
+
+    asyncio.run(main())
+    ledger.close()
+
+
+def test_done_survives_reopen(tmp_path):
+    path = str(tmp_path / "s.sqlite3")
+
+    async def send():
+        ledger = SubmissionLedger(path)
+        assert await ledger.begin(OWNER, _key()) is None
+        await ledger.complete(OWNER, _key(), job_id=7)
+        ledger.close()
+
+    async def again():
+        # нова пам'ять, той самий файл — як після перезапуску
+        ledger = SubmissionLedger(path)
+        try:
+            assert not ledger.recently_sent(OWNER)
+            assert await ledger.begin(OWNER, _key()) == DONE
+            assert not ledger.sending(OWNER)
+        finally:
+            ledger.close()
+
+    asyncio.run(send())
+    asyncio.run(again())
+
+
+def test_keys_expire_after_keep_sec(tmp_path, monkeypatch):
+    path = str(tmp_path / "s.sqlite3")
+    ledger = SubmissionLedger(path, keep_sec=60)
+
+    async def complete(key: str):
+        assert await ledger.begin(OWNER, key) is None
+        await ledger.complete(OWNER, key)
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    asyncio.run(complete(_key()))
+    # старі ключі чистить наступний запис, коли минуло keep_sec
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    asyncio.run(complete(_key("Петренко")))
+    ledger.close()
+
+    reopened = SubmissionLedger(path, keep_sec=60)
+    assert asyncio.run(reopened.begin(OWNER, _key())) is None
+    reopened.abort(OWNER)
+    assert asyncio.run(reopened.begin(OWNER, _key("Петренко"))) == DONE
+    reopened.close()
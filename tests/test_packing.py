@@ -0,0 +1,45 @@
+from packing import pack, part_subject
+
+
+def _sizes(groups: list[list[int]], sizes: list[int]) -> list[int]:
+    return [sum(sizes[i] for i in g) for g in groups]
+
+
+def test_everything_fits_in_one_part():
+    assert pack([10, 20, 30], 100) == [[0, 1, 2]]
+
+
+def test_no_attachments_is_one_empty_part():
+    assert pack([], 100) == [[]]
+
+
+def test_first_fit_decreasing():
+    sizes = [40, 70, 30, 60, 20]
+    groups = pack(sizes, 100)
+    # за спаданням: 70 -> #1, 60 -> #2, 40 -> #2, 30 -> #1, 20 -> #3 (100 і 100 уже повні)
+    assert groups == [[0, 3], [1, 2], [4]]
+    assert all(s <= 100 for s in _sizes(groups, sizes))
+    assert sorted(i for g in groups for i in g) == list(range(len(sizes)))
+
+
+def test_oversize_item_goes_alone():
+    sizes = [30, 250, 40, 500]
+    groups = pack(sizes, 100)
+    assert [1] in groups and [3] in groups
+    assert [0, 2] in groups
+    assert len(groups) == 3
+
+
+def test_parts_ordered_by_first_attachment():
+    # "частина i/n" іде в порядку вкладень: перша частина містить вкладення 0
+    sizes = [10, 90, 90, 90]
+    groups = pack(sizes, 100)
+    assert groups == [[0, 1], [2], [3]]
+    assert [g[0] for g in groups] == sorted(g[0] for g in groups)
+
+
+def test_part_subject_numbering():
+    assert part_subject("(заявка) Іваненко", 0, 1) == "(заявка) Іваненко"
+    assert [part_subject("Тема", i, 3) for i in range(3)] == [
+        "Тема (частина 1/3)", "Тема (частина 2/3)", "Тема (частина 3/3)",
+    ]
@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+from routing import DEFAULT, Destination, load_routing
+
+BASE = Destination(DEFAULT, ("inbox@example.com",), "bot@example.com", "smtp.example.com", 465,
+                   "bot@example.com", "secret")
+
+
+def _load(tmp_path, raw: dict):
+    path = tmp_path / "routes.json"
+    path.write_text(json.dumps(raw), encoding="utf-8")
+    return load_routing(str(path), BASE)
+
+
+def test_same_login_shares_the_default_password(tmp_path):
+    table = _load(tmp_path, {"destinations": {"crm": {"to": "crm@example.com"}}})
+    assert table.destinations["crm"].server == BASE.server
+    assert table.destinations["crm"].password == "secret"
+
+
+def test_same_login_with_another_password_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="різні паролі"):
+        _load(tmp_path, {"destinations": {"crm": {"to": "crm@example.com", "password": "other"}}})
+
+
+def test_another_login_may_have_its_own_password(tmp_path):
+    table = _load(tmp_path, {"destinations": {
+        "crm": {"to": "crm@example.com", "user": "crm@example.com", "password": "other"},
+    }})
+    assert table.destinations["crm"].server != BASE.server
@@ -0,0 +1,67 @@
+import asyncio
+
+from smtp_sink import SMTPSink
+from smtp_test import Profiler, build_parser, probe_sessions
+
+
+def _args(port: int, *extra: str):
+    return build_parser().parse_args([
+        "--host", "127.0.0.1", "--port", str(port), "--security", "none",
+        "--user", "probe@example.com", "--password", "secret", *extra,
+    ])
+
+
+async def _with_sink(sink: SMTPSink, run):
+    port = await sink.start()
+    try:
+        return await run(port)
+    finally:
+        await sink.stop()
+
+
+def test_profiler_times_every_phase():
+    sink = SMTPSink()
+
+    async def run(port):
+        a = _args(port, "-n", "3", "--send-to", "inbox@example.com",
+                  "--mail-from", "probe@example.com", "--size-kb", "64")
+        return await Profiler(a).run()
+
+    report = asyncio.run(_with_sink(sink, run))
+    assert report["errors"] == []
+    for phase in ("dns", "tcp", "banner", "ehlo", "auth", "data", "quit"):
+        assert report["phases_ms"][phase]["n"] == 3
+    # security none — TLS не міряється
+    assert "tls_full" not in report["phases_ms"]
+    assert {"pipelining", "chunking", "auth"} <= set(report["extensions"])
+    assert report["size_limit"] is None  # синк оголошує SIZE 0
+    assert sink.messages == 3
+
+
+def test_probe_sessions_reports_measured_limit():
+    sink = SMTPSink(max_sessions=3)
+
+    async def run(port):
+        result = await probe_sessions(_args(port, "--sessions", "10"), "probe@example.com")
+        await asyncio.sleep(0.05)  # синк дочитує QUIT
+        return result
+
+    result = asyncio.run(_with_sink(sink, run))
+    assert result["max_sessions"] == 3
+    assert result["limit_reached"]
+    assert "421" in result["refused"]
+    assert result["recommended_pool"] == 2 and result["margin"] == 1
+    assert sink.active == 0
+
+
+def test_probe_sessions_stops_at_requested_count():
+    sink = SMTPSink()
+
+    async def run(port):
+        return await probe_sessions(_args(port, "--sessions", "4", "--margin", "0"), None)
+
+    result = asyncio.run(_with_sink(sink, run))
+    assert result["max_sessions"] == 4
+    assert not result["limit_reached"] and result["refused"] is None
+    assert result["recommended_pool"] == 4
+    assert sink.sessions == 4
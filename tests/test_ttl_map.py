@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from ttl_map import TTLMap
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_max_size_evicts_nearest_deadline(clock):
+    m = TTLMap(ttl=60, max_size=3)
+    m.set("short", 1, ttl=10)
+    m["a"] = 2
+    m["b"] = 3
+    m["c"] = 4
+    assert len(m) == 3
+    assert "short" not in m
+    assert sorted(m) == ["a", "b", "c"]
+
+
+def test_overwrite_extends_life(clock):
+    m = TTLMap(ttl=10, max_size=2)
+    m["a"] = 1
+    clock[0] += 5
+    m["b"] = 2
+    m["a"] = 11  # тепер "a" живе довше за "b"
+    m["c"] = 3
+    assert sorted(m) == ["a", "c"]
+    assert m["a"] == 11
+
+
+def test_expire_in_deadline_order(clock):
+    m = TTLMap(ttl=30)
+    m.set("late", 1, ttl=30)
+    m.set("early", 2, ttl=10)
+    m.set("mid", 3, ttl=20)
+    clock[0] += 15
+    assert "early" not in m and m.get("early") is None
+    assert m.expire() == 0  # get уже прибрав "early"
+    clock[0] += 10
+    assert m.expire() == 1
+    assert list(m) == ["late"]
+    clock[0] += 10
+    assert m.expire() == 1
+    assert len(m) == 0 and not m._heap
+
+
+def test_pop_and_deadline(clock):
+    m = TTLMap(ttl=10)
+    m["a"] = 1
+    assert m.deadline("a") == 1010.0
+    assert m.pop("a") == 1
+    assert m.pop("a", "gone") == "gone"
+    m["b"] = 2
+    clock[0] += 10
+    assert m.deadline("b") is None
+    assert m.pop("b") is None
+    with pytest.raises(KeyError):
+        m["b"]
+
+
+def test_heap_compacts_after_many_overwrites(clock):
+    m = TTLMap(ttl=60)
+    for i in range(10_000):
+        m["hot"] = i
+        m[i % 5] = i
+    assert len(m) == 6
+    # мертві записи перезаписаних ключів не накопичуються
+    assert len(m._heap) <= 2 * len(m) + 64 + 1
+    assert m["hot"] == 9999
+    clock[0] += 61
+    assert m.expire() == 6
+    assert not m._heap
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import socket
+
+import aiohttp
+
+from fake_telegram import FakeTelegram
+from run import TOKEN, BotProcess, _bot_env
+from smtp_sink import SMTPSink
+
+SECRET = "s3cret-token"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_healthy(session: aiohttp.ClientSession, url: str, bot: BotProcess):
+    for _ in range(300):
+        if bot.proc.returncode is not None:
+            raise RuntimeError("бот завершився до старту")
+        try:
+            async with session.get(url) as r:
+                if r.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.1)
+    raise TimeoutError(url)
+
+
+def test_webhook_checks_secret_token(tmp_path):
+    fake = FakeTelegram(TOKEN)
+    sink = SMTPSink()
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+
+    async def main():
+        runner, api_url = await fake.start()
+        smtp_port = await sink.start()
+        env = _bot_env(api_url, smtp_port, False, {
+            "WEBHOOK_MODE": "1", "WEBHOOK_SECRET": SECRET, "WEBAPP_HOST": "127.0.0.1", "WEBAPP_PORT": str(port),
+        })
+        bot = BotProcess(env, str(tmp_path))
+        await bot.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                await _wait_healthy(session, base + "/healthz", bot)
+
+                # записаний Update, як його шле Telegram; чужий секрет — інший чат, щоб розрізнити відповіді
+                forged = {"update_id": 1, "message": fake.message(111, 111, text="/start")}
+                real = {"update_id": 2, "message": fake.message(222, 222, text="/start")}
+                answered = fake.expect(lambda c: c["method"] == "sendMessage" and c["chat_id"] == 222)
+                leaked = fake.expect(lambda c: c["chat_id"] == 111)
+
+                headers = {"X-Telegram-Bot-Api-Secret-Token": "wrong"}
+                async with session.post(base + "/tg/webhook", json=forged, headers=headers) as r:
+                    assert r.status == 401
+                async with session.post(base + "/tg/webhook", json=forged) as r:
+                    assert r.status == 401
+                headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+                async with session.post(base + "/tg/webhook", json=real, headers=headers) as r:
+                    assert r.status == 200
+
+                reply = await asyncio.wait_for(answered, 30)
+                assert "/zayavka" in reply["text"]
+                # апдейти обробляються по черзі надходження — підроблений уже мав би відповідь
+                await asyncio.sleep(0.5)
+                assert not leaked.done()
+                leaked.cancel()
+        finally:
+            await bot.stop()  # SIGINT: webhook-режим теж проходить finally в main()
+            await runner.cleanup()
+            await sink.stop()
+        return bot.proc.returncode
+
+    returncode = asyncio.run(main())
+    assert returncode == 0, open(os.path.join(tmp_path, "bot.log")).read()[-2000:]
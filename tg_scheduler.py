@@ -0,0 +1,129 @@
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+# прибирання можна відкласти — питання й відповіді користувачу йдуть першими;
+# почат-чатовий ліміт Telegram — про надіслані повідомлення, тож їх він не рахує
+LOW_PRIORITY = {"deleteMessage", "deleteMessages"}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # після RetryAfter
+
+    def delay(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self):
+        self.tokens -= 1
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Request-middleware бота: кожен вихідний виклик Bot API проходить тут.
+
+    Виклики, що пишуть у чат, чекають на токени глобального і почат-чатового
+    бакетів (у групах — жорсткіший ліміт). Видалення повідомлень беруть лише
+    глобальний токен і не забирають останнього, поки питання того ж чату чекає
+    своєї черги. ``TelegramRetryAfter`` блокує бакет чату на вказаний час і
+    повторює запит до ``max_retries`` разів.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 group_per_min: float = 20.0, max_retries: int = 3, idle_ttl: float = 600.0):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_per_min / 60.0
+        self.max_retries = max_retries
+        self.idle_ttl = idle_ttl
+        self._chats: dict[int | str, TokenBucket] = {}
+        self._urgent: dict[int | str, int] = {}  # скільки пріоритетних викликів чекає на чат
+        self._last_gc = time.monotonic()
+
+    def _bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # від'ємні id — групи й канали
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.chat_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _gc(self, now: float):
+        if now - self._last_gc < self.idle_ttl:
+            return
+        self._last_gc = now
+        for chat_id in [c for c, b in self._chats.items() if now - b.updated > self.idle_ttl]:
+            if not self._urgent.get(chat_id):
+                del self._chats[chat_id]
+
+    async def _acquire(self, chat_id: int | str, low: bool):
+        bucket = self._bucket(chat_id)
+        if not low:
+            self._urgent[chat_id] = self._urgent.get(chat_id, 0) + 1
+        try:
+            while True:
+                now = time.monotonic()
+                wait = self.global_bucket.delay(now)
+                if not low:
+                    wait = max(wait, bucket.delay(now))
+                else:
+                    # токенів чату не беремо, але RetryAfter чату поважаємо
+                    wait = max(wait, bucket.blocked_until - now)
+                    if self._urgent.get(chat_id) and self.global_bucket.tokens < 2:
+                        wait = max(wait, 1.0 / self.global_bucket.rate)
+                if wait <= 0:
+                    self.global_bucket.take()
+                    if not low:
+                        bucket.take()
+                    return
+                await asyncio.sleep(wait)
+        finally:
+            if not low:
+                left = self._urgent[chat_id] - 1
+                if left:
+                    self._urgent[chat_id] = left
+                else:
+                    del self._urgent[chat_id]
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        api_method = method.__api_method__
+        chat_id = getattr(method, "chat_id", None)
+        throttled = chat_id is not None and not api_method.startswith("get")
+        self._gc(time.monotonic())
+
+        attempt = 0
+        while True:
+            if throttled:
+                await self._acquire(chat_id, api_method in LOW_PRIORITY)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                if throttled:
+                    # наступний _acquire сам дочекається розблокування чату
+                    bucket = self._bucket(chat_id)
+                    bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + e.retry_after)
+                else:
+                    await asyncio.sleep(e.retry_after)
@@ -0,0 +1,121 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Generic, Hashable, Iterator, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLMap(Generic[K, V]):
+    """Словник, записи якого зникають після дедлайну.
+
+    Дедлайни лежать у min-heap, тож вставка — O(log n), а прострочене
+    знімається з вершини купи без перебору всього словника. Перезапис ключа
+    не шукає старий запис у купі: він лишається там «мертвим» і пропускається,
+    коли дійде до вершини. Понад ``max_size`` витісняються записи з
+    найближчим дедлайном. ``start()`` запускає фоновий reaper, але й без нього
+    прострочене не видно ззовні — читання перевіряє дедлайн.
+    """
+
+    def __init__(self, ttl: float, max_size: int | None = None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: dict[K, tuple[V, float]] = {}
+        self._heap: list[tuple[float, int, K]] = []
+        self._seq = itertools.count()  # щоб купа не порівнювала ключі
+        self._reaper: asyncio.Task | None = None
+
+    def set(self, key: K, value: V, ttl: float | None = None):
+        deadline = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, deadline)
+        heapq.heappush(self._heap, (deadline, next(self._seq), key))
+        if self.max_size is not None and len(self._data) > self.max_size:
+            self.expire()
+            while len(self._data) > self.max_size:
+                self._pop_head()
+        elif len(self._heap) > 2 * len(self._data) + 64:
+            self._compact()
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        if item[1] <= time.monotonic():
+            del self._data[key]
+            return default
+        return item[0]
+
+    def pop(self, key: K, default: V | None = None) -> V | None:
+        item = self._data.pop(key, None)
+        if item is None or item[1] <= time.monotonic():
+            return default
+        return item[0]
+
+    def deadline(self, key: K) -> float | None:
+        item = self._data.get(key)
+        return item[1] if item is not None and item[1] > time.monotonic() else None
+
+    def __setitem__(self, key: K, value: V):
+        self.set(key, value)
+
+    def __getitem__(self, key: K) -> V:
+        item = self._data.get(key)
+        if item is None or item[1] <= time.monotonic():
+            raise KeyError(key)
+        return item[0]
+
+    def __delitem__(self, key: K):
+        del self._data[key]
+
+    def __contains__(self, key: object) -> bool:
+        item = self._data.get(key)  # type: ignore[arg-type]
+        return item is not None and item[1] > time.monotonic()
+
+    def __len__(self) -> int:
+        # може включати ще не прибрані прострочені записи
+        return len(self._data)
+
+    def __iter__(self) -> Iterator[K]:
+        now = time.monotonic()
+        return iter([k for k, (_, deadline) in self._data.items() if deadline > now])
+
+    def clear(self):
+        self._data.clear()
+        self._heap.clear()
+
+    # ---------- прибирання ----------
+    def _pop_head(self):
+        deadline, _, key = heapq.heappop(self._heap)
+        item = self._data.get(key)
+        if item is not None and item[1] == deadline:
+            del self._data[key]
+
+    def expire(self) -> int:
+        """Прибирає прострочені записи; повертає, скільки їх було."""
+        now = time.monotonic()
+        before = len(self._data)
+        while self._heap and self._heap[0][0] <= now:
+            self._pop_head()
+        return before - len(self._data)
+
+    def _compact(self):
+        # купа розрослася через перезаписи — перебудовуємо з живих записів
+        self._heap = [(deadline, next(self._seq), key) for key, (_, deadline) in self._data.items()]
+        heapq.heapify(self._heap)
+
+    async def _reap(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.expire()
+
+    def start(self, interval: float = 30.0):
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap(interval))
+
+    async def stop(self):
+        if self._reaper:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+            self._reaper = None